@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+benchmark.py
+
+Hardware-free benchmarks for the control path.
+
+The sensor, GPIO, lircd and MQTT are replaced with fake_dht, fake_gpio, fake_lircd
+and fake_mqtt, so this runs anywhere.  Record a baseline, then compare against it
+before deploying:
+
+    python benchmark.py --save
+    python benchmark.py
+
+Comparing exits with status 1 if any benchmark is slower than the baseline by
+more than the tolerance.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+import fake_dht
+import fake_gpio
+
+# gpio imports the real drivers, so put the fakes in their place
+fake_gpio.install()
+
+# pylint: disable=wrong-import-position
+import codec
+import gpio
+import heatpump_controller
+import iot
+from fake_lircd import FakeLircd
+from fake_mqtt import FakeMQTTClient
+
+BASELINE = 'benchmark_baseline.json'
+
+class _LEDVerify(object):
+    """LEDVerify which always sees the LEDs fire, without the latch delays"""
+    state = True
+
+    def reset(self):
+        """Nothing to reset"""
+        pass
+
+class Fixture(object):
+    """A controller wired to fake hardware and an in-process MQTT client"""
+    def __init__(self):
+        self.directory = tempfile.mkdtemp()
+        self.lircd = FakeLircd(os.path.join(self.directory, 'lircd'))
+
+        self.iot = iot.IoT('benchmark')
+        self.iot.mqtt_client = FakeMQTTClient()
+
+        self.controller = heatpump_controller.HeatpumpController({
+            'dht': {'data_pin': 22, 'onoff_pin': 18, 'warm_up': 0},
+            'led_verify': {'le_pin': 25, 'd0_pin': 17, 'q0_pin': 24},
+            'lirc': {'socket': self.lircd.server_address},
+            'default_setpoints': heatpump_controller.DEFAULT_SETPOINTS
+        })
+        self.controller.heatpump.led_verify = _LEDVerify()
+        self.controller.iot = self.iot
+
+    def close(self):
+        """Stops the fakes"""
+        self.iot.stop_publisher()
+        self.controller.heatpump.lirc.close()
+        self.lircd.stop()
+        shutil.rmtree(self.directory)
+
+def _cycle(values):
+    state = {'index': 0}
+    def _next():
+        state['index'] = (state['index'] + 1) % len(values)
+        return values[state['index']]
+    return _next
+
+def bench_get_action(fixture):
+    """Heatpump.get_action across the setpoint range"""
+    heatpump = fixture.controller.heatpump
+    temperature = _cycle([value / 10.0 for value in range(100, 300)])
+    return lambda: heatpump.get_action(temperature())
+
+def bench_process_state(fixture):
+    """process_state, sending an IR command through lircd every time"""
+    sample = _cycle([gpio.Sample(50, 10), gpio.Sample(50, 30)])
+    return lambda: fixture.controller.process_state(sample())
+
+def bench_send_sample(fixture):
+    """send_sample, publishing every time"""
+    sample = _cycle([gpio.Sample(50, 20), gpio.Sample(55, 21)])
+    return lambda: fixture.controller.send_sample(sample())
+
+def bench_publish(fixture):
+    """Synchronous IoT.publish"""
+    topic = fixture.iot.topics['shadow_update']
+    return lambda: fixture.iot.publish(topic, {'state': {'reported': {'temperature': 20}}})
+
+def bench_publish_queued(fixture):
+    """Queued IoT.publish, as seen by the caller"""
+    fixture.iot.start_publisher(maxsize=100000)
+    return bench_publish(fixture)
+
+def bench_decode(_fixture):
+    """Decoding a shadow update document, as the controller receives from the gas sensor"""
+    reported = {'temperature': 45.25, 'thing': '40stokesMCP'}
+    document = codec.dumps({
+        'previous': {'state': {'reported': reported},
+                     'metadata': {'reported': {'temperature': {'timestamp': 1500000000}}},
+                     'version': 100},
+        'current': {'state': {'reported': reported},
+                    'metadata': {'reported': {'temperature': {'timestamp': 1500000002}}},
+                    'version': 101},
+        'timestamp': 1500000002})
+    return lambda: codec.loads(document)
+
+def bench_loop(fixture):
+    """A full iteration: sample the DHT22, process_state and send_sample"""
+    temperature = _cycle([10.0, 30.0])
+    controller = fixture.controller
+    def _loop():
+        fake_dht.temperature = temperature()
+        sample = controller.dht22.sample
+        controller.process_state(sample)
+        controller.send_sample(sample)
+    return _loop
+
+BENCHMARKS = [
+    ('get_action', bench_get_action, 20000),
+    ('process_state', bench_process_state, 500),
+    ('send_sample', bench_send_sample, 5000),
+    ('publish', bench_publish, 5000),
+    ('publish_queued', bench_publish_queued, 5000),
+    ('decode', bench_decode, 5000),
+    ('loop', bench_loop, 200),
+]
+
+def run(repeat=3):
+    """Runs the benchmarks, returning the best time per call in microseconds"""
+    results = {}
+    for name, benchmark, number in BENCHMARKS:
+        fixture = Fixture()
+        try:
+            timer = timeit.Timer(benchmark(fixture))
+            best = min(timer.repeat(repeat, number))
+        finally:
+            fixture.close()
+        results[name] = best / number * 1e6
+    return results
+
+def compare(results, baseline, tolerance):
+    """Prints the results against the baseline, returning the regressed names"""
+    regressions = []
+    print '%-16s %12s %12s %8s' % ('benchmark', 'us/call', 'baseline', 'change')
+    for name, _benchmark, _number in BENCHMARKS:
+        current = results[name]
+        previous = baseline.get(name)
+        if previous:
+            change = current / previous - 1
+            flag = ''
+            if change > tolerance:
+                regressions.append(name)
+                flag = ' !'
+            print '%-16s %12.2f %12.2f %+7.0f%%%s' % (name, current, previous,
+                                                      change * 100, flag)
+        else:
+            print '%-16s %12.2f %12s %8s' % (name, current, '-', '-')
+    return regressions
+
+def main():
+    """Runs the benchmarks from the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--save', action='store_true', help='save results as the baseline')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown before failing, default 0.25')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        return 0
+
+    if regressions:
+        print 'regressed: %s' % ', '.join(regressions)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
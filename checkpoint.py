@@ -0,0 +1,84 @@
+"""
+Checkpoints of a controller's state, so a restart can pick up where it left off.
+
+A checkpoint is a JSON object written to a temporary file, synced and renamed
+over the previous one, so a crash leaves either the old or the new checkpoint
+but never a torn one.
+"""
+import logging
+import os
+import threading
+import time
+
+import codec
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+def save(path, state):
+    """Writes state, a dict, to path atomically, noting when it was saved"""
+    state = dict(state, saved=time.time())
+    with open(path + '.tmp', 'w') as checkpoint_file:
+        checkpoint_file.write(codec.dumps(state))
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.rename(path + '.tmp', path)
+
+def load(path, max_age=None):
+    """
+    Reads the checkpoint at path.
+
+    Returns None if there is no checkpoint, it can't be read, or it was saved
+    more than max_age seconds ago.
+    """
+    try:
+        with open(path, 'r') as checkpoint_file:
+            state = codec.loads(checkpoint_file.read())
+        saved = state['saved']
+    except (IOError, ValueError, KeyError, TypeError) as error:
+        if not isinstance(error, IOError) or os.path.exists(path):
+            logger.warning('ignoring unreadable checkpoint %s: %s', path, error)
+        return None
+
+    age = time.time() - saved
+    if max_age is not None and age > max_age:
+        logger.info('ignoring checkpoint %s, saved %ds ago', path, age)
+        return None
+    return state
+
+class Checkpointer(object):
+    """Periodically saves the state returned by snapshot"""
+    def __init__(self, path, snapshot, interval=30):
+        self.path = path
+        self.snapshot = snapshot
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the checkpoint thread"""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='checkpoint')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the checkpoint thread, saving a final checkpoint"""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(5)
+        self._thread = None
+        try:
+            self.checkpoint()
+        except (IOError, OSError):
+            logger.exception('could not save checkpoint')
+
+    def checkpoint(self):
+        """Saves the current state"""
+        save(self.path, self.snapshot())
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.checkpoint()
+            except Exception: # pylint: disable=broad-except
+                logger.exception('could not save checkpoint')
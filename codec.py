@@ -0,0 +1,70 @@
+"""
+JSON encoding for MQTT and local messages.
+
+Uses ujson or simplejson when one is installed, falling back to the standard
+library.  Reported states are encoded with templates compiled once for each
+set of keys, so only the values are encoded for each message.
+"""
+import threading
+
+try:
+    import ujson as _json
+except ImportError:
+    try:
+        import simplejson as _json
+    except ImportError:
+        import json as _json
+
+NAME = _json.__name__
+
+# plenty for the handful of shapes each thing reports
+_MAX_TEMPLATES = 64
+
+_templates = {} # pylint: disable=invalid-name
+_lock = threading.Lock() # pylint: disable=invalid-name
+
+def dumps(obj):
+    """Encodes obj as JSON"""
+    return _json.dumps(obj)
+
+def loads(text):
+    """Decodes JSON text"""
+    return _json.loads(text)
+
+class ReportedTemplate(object):
+    """
+    Encoder for a shadow update reporting a fixed set of keys for a thing.
+
+    thing is always reported, replacing any thing in the values.
+    """
+    def __init__(self, keys, thing):
+        self.keys = tuple(key for key in keys if key != 'thing')
+        fields = ['%s:%%s' % dumps(key).replace('%', '%%') for key in self.keys]
+        fields.append('"thing":%s' % dumps(thing).replace('%', '%%'))
+        self._format = '{"state":{"reported":{%s}}}' % ','.join(fields)
+
+    def encode(self, reported):
+        """Encodes reported, which must have this template's keys"""
+        return self._format % tuple(_encode_value(reported[key]) for key in self.keys)
+
+def encode_reported(reported, thing):
+    """Encodes a shadow update reporting reported for thing"""
+    keys = tuple(sorted(reported))
+    try:
+        template = _templates[(keys, thing)]
+    except KeyError:
+        template = ReportedTemplate(keys, thing)
+        with _lock:
+            if len(_templates) >= _MAX_TEMPLATES:
+                _templates.clear()
+            _templates[(keys, thing)] = template
+    return template.encode(reported)
+
+def _encode_value(value):
+    # floats and ints are by far the most common, and repr matches json's output
+    # for finite floats
+    if value.__class__ is float and value - value == 0:
+        return repr(value)
+    if value.__class__ is int:
+        return str(value)
+    return dumps(value)
@@ -0,0 +1,116 @@
+"""
+Reloading config.yaml while running.
+
+ConfigWatcher polls the file's modification time and hands each new config to
+a callback, which applies what it can in place; things which can't be changed
+in place are applied by restarting the process.
+"""
+import fcntl
+import logging
+import os
+import sys
+import threading
+
+import yaml
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+def load(path):
+    """Loads the config from path"""
+    with open(path, 'r') as stream:
+        return yaml.safe_load(stream)
+
+def changed_keys(old, new):
+    """The keys whose values differ between the old and new config dicts"""
+    old = old or {}
+    new = new or {}
+    return set(key for key in set(old) | set(new) if old.get(key) != new.get(key))
+
+def restart():
+    """
+    Replaces this process with a fresh copy of itself.
+
+    Stop the things and disconnect first.  Python 2 leaves files and sockets
+    open across exec, so anything still open is closed by the exec rather than
+    leaked into the new process.
+    """
+    logger.warning('restarting to apply config')
+    sys.stdout.flush()
+    sys.stderr.flush()
+    close_on_exec()
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+def close_on_exec():
+    """Marks every open file descriptor but stdin, stdout and stderr close-on-exec"""
+    try:
+        descriptors = [int(name) for name in os.listdir('/proc/self/fd')]
+    except OSError:
+        descriptors = range(3, min(os.sysconf('SC_OPEN_MAX'), 4096))
+    for descriptor in descriptors:
+        if descriptor < 3:
+            continue
+        try:
+            flags = fcntl.fcntl(descriptor, fcntl.F_GETFD)
+            fcntl.fcntl(descriptor, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+        except IOError:
+            pass # closed since it was listed
+
+class ConfigWatcher(object):
+    """
+    Watches a config file for changes.
+
+    Every interval seconds the file's modification time and size are checked,
+    and if either changed the file is loaded and on_change is called with the
+    new config.  A file which can't be loaded is logged and otherwise ignored
+    until it changes again.
+    """
+    def __init__(self, path, on_change, interval=5):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self._signature = self._stat()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the watcher thread"""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='config')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the watcher thread"""
+        self._stopped.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(5)
+        self._thread = None
+
+    def check(self):
+        """Calls on_change if the file has changed since it was last checked"""
+        signature = self._stat()
+        if signature == self._signature:
+            return
+        self._signature = signature
+
+        try:
+            config = load(self.path)
+        except (IOError, yaml.YAMLError) as error:
+            logger.error('could not load %s: %s', self.path, error)
+            return
+        logger.info('%s changed', self.path)
+        self.on_change(config)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime, stat.st_size)
+        except OSError:
+            return None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception: # pylint: disable=broad-except
+                logger.exception('could not apply %s', self.path)
@@ -0,0 +1,13 @@
+"""Stand-in for Adafruit_DHT, reading a steady signal with a little noise"""
+import random
+
+DHT22 = 22
+
+humidity = 50.0 #pylint: disable=invalid-name
+temperature = 20.0 #pylint: disable=invalid-name
+noise = 0.3 #pylint: disable=invalid-name
+
+def read_retry(_sensor, _pin):
+    """Returns (humidity, temperature) like Adafruit_DHT.read_retry"""
+    return (humidity + random.uniform(-noise, noise),
+            temperature + random.uniform(-noise, noise))
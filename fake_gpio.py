@@ -1,12 +1,29 @@
 #pylint: disable=missing-docstring, invalid-name, multiple-statements
+import sys
+import types
 
+def _(): pass
 def _a(_a): pass
 def _a_b(_a, _b): pass
 
 input = _a #pylint: disable=redefined-builtin
 setup = output = _a_b
+setmode = _a
+cleanup = _
 
 IN = 0
 OUT = 1
 LOW = 0
 HIGH = 1
+BCM = 11
+
+def install():
+    """Puts the fakes in place of RPi.GPIO, Adafruit_DHT and smbus"""
+    import fake_dht
+    import fake_smbus
+    rpi = types.ModuleType('RPi')
+    rpi.GPIO = sys.modules[__name__]
+    sys.modules.setdefault('RPi', rpi)
+    sys.modules.setdefault('RPi.GPIO', rpi.GPIO)
+    sys.modules.setdefault('Adafruit_DHT', fake_dht)
+    sys.modules.setdefault('smbus', fake_smbus)
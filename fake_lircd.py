@@ -0,0 +1,50 @@
+"""Local stand-in for lircd, listening on a Unix socket"""
+import os
+import socket
+import SocketServer
+import threading
+
+class _Handler(SocketServer.StreamRequestHandler):
+    """
+    Answers lircd commands, failing any code named 'broken', answering 'empty'
+    with an empty packet and never answering 'silent'
+    """
+    def handle(self):
+        self.server.connections.append(self.connection)
+        self.wfile.write('BEGIN\nSIGHUP\nEND\n')
+        for line in self.rfile:
+            command = line.strip()
+            self.server.commands.append(command)
+            if command.endswith('broken'):
+                reply = 'BEGIN\n%s\nERROR\nDATA\n1\nunknown command\nEND\n' % command
+            elif command.endswith('empty'):
+                reply = 'BEGIN\nEND\n'
+            elif command.endswith('silent'):
+                continue
+            else:
+                reply = 'BEGIN\n%s\nSUCCESS\nEND\n' % command
+            self.wfile.write(reply)
+            self.wfile.flush()
+
+class FakeLircd(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """Serves lircd's protocol on socket_path until stopped"""
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        SocketServer.UnixStreamServer.__init__(self, socket_path, _Handler)
+        self.commands = []
+        self.connections = []
+        thread = threading.Thread(target=self.serve_forever, args=(0.01,))
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """Stops serving, drops the clients and removes the socket"""
+        self.shutdown()
+        self.server_close()
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass # already closed by the client
+        os.remove(self.server_address)
@@ -0,0 +1,45 @@
+"""In-process stand-in for AWSIoTMQTTClient"""
+import threading
+
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishQueueDisabledException
+
+class FakeMQTTClient(object):
+    """Records publishes and delivers them to matching subscriptions"""
+    def __init__(self):
+        self.published = []
+        self.subscriptions = {}
+        self.up = True
+        self.onOnline = None # pylint: disable=invalid-name
+        self.onOffline = None # pylint: disable=invalid-name
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """Brings the connection (back) up"""
+        self.up = True
+        if self.onOnline:
+            self.onOnline()
+
+    def disconnect(self):
+        """Takes the connection down"""
+        self.up = False
+        if self.onOffline:
+            self.onOffline()
+
+    def subscribe(self, topic, _qos, callback):
+        """Registers callback for messages published to topic"""
+        self.subscriptions.setdefault(topic, []).append(callback)
+
+    def publish(self, topic, payload, _qos):
+        """Records the message and delivers it to subscribers"""
+        if not self.up:
+            raise publishQueueDisabledException()
+        with self._lock:
+            self.published.append((topic, payload))
+        for callback in self.subscriptions.get(topic, []):
+            callback(self, None, _Message(topic, payload))
+        return True
+
+class _Message(object): # pylint: disable=too-few-public-methods
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
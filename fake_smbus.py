@@ -0,0 +1,39 @@
+"""Stand-in for smbus, with an MCP9000 thermocouple amplifier on the bus"""
+
+hot = 20.0 #pylint: disable=invalid-name
+cold = 18.0 #pylint: disable=invalid-name
+
+def encode(temperature):
+    """Encodes temperature as the MCP9000's two's complement, 1/16 degree bytes"""
+    value = int(round(temperature * 16)) & 0xffff
+    return [value >> 8, value & 0xff]
+
+class SMBus(object):
+    """Records bus transactions and answers like an MCP9000"""
+    def __init__(self, bus):
+        self.bus = bus
+        self.registers = {0x04: 0, 0x05: 0, 0x06: 0}
+        self.transactions = []
+
+    def write_byte(self, address, value):
+        """Sets the register pointer"""
+        self.transactions.append(('write_byte', address, value))
+
+    def write_byte_data(self, address, register, value):
+        """Writes a register; selecting burst mode completes a burst at once"""
+        self.transactions.append(('write_byte_data', address, register, value))
+        if register == 0x04:
+            value = self.registers[0x04] & ~0xc0 | value & 0xc0
+        self.registers[register] = value
+        if register == 0x06 and value & 0x03 == 0x02:
+            self.registers[0x04] |= 0xc0
+
+    def read_byte_data(self, address, register):
+        """Reads a one byte register"""
+        self.transactions.append(('read_byte_data', address, register))
+        return self.registers.get(register, 0)
+
+    def read_i2c_block_data(self, address, register, length):
+        """Reads a temperature register"""
+        self.transactions.append(('read_i2c_block_data', address, register, length))
+        return {0x00: encode(hot), 0x02: encode(cold)}.get(register, [0] * length)[:length]
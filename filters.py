@@ -0,0 +1,117 @@
+"""
+Streaming filters for denoising sensor readings.
+
+Each filter keeps its state between readings, so history carries over from one
+sample to the next rather than being thrown away.
+"""
+import bisect
+from collections import deque
+
+MEDIAN = 'median'
+EWMA = 'ewma'
+KALMAN = 'kalman'
+
+class RollingMedian(object):
+    """
+    Median of the last window readings.
+
+    The window is kept sorted, so each reading is located with a binary search
+    rather than re-sorting the whole window.
+    """
+    def __init__(self, window=3):
+        if window < 1:
+            raise ValueError('window must be at least 1')
+        self.window = window
+        self._readings = deque()
+        self._sorted = []
+
+    def update(self, reading):
+        """Adds a reading, returning the new median"""
+        if len(self._readings) == self.window:
+            oldest = self._readings.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+        self._readings.append(reading)
+        bisect.insort(self._sorted, reading)
+        return self.value
+
+    @property
+    def value(self):
+        """The current median, or None if there have been no readings"""
+        count = len(self._sorted)
+        if not count:
+            return None
+        middle = count // 2
+        if count % 2:
+            return self._sorted[middle]
+        return (self._sorted[middle - 1] + self._sorted[middle]) / 2.0
+
+class ExponentialMovingAverage(object):
+    """Exponentially weighted moving average"""
+    def __init__(self, alpha=0.3):
+        if not 0 < alpha <= 1:
+            raise ValueError('alpha must be in (0, 1]')
+        self.alpha = alpha
+        self._value = None
+
+    def update(self, reading):
+        """Adds a reading, returning the new average"""
+        if self._value is None:
+            self._value = float(reading)
+        else:
+            self._value += self.alpha * (reading - self._value)
+        return self._value
+
+    @property
+    def value(self):
+        """The current average, or None if there have been no readings"""
+        return self._value
+
+class Kalman(object):
+    """One dimensional Kalman filter for a slowly changing value"""
+    def __init__(self, process_variance=0.01, measurement_variance=0.25):
+        self.process_variance = process_variance
+        self.measurement_variance = measurement_variance
+        self._value = None
+        self._error = None
+
+    def update(self, reading):
+        """Adds a reading, returning the new estimate"""
+        if self._value is None:
+            self._value = float(reading)
+            self._error = self.measurement_variance
+            return self._value
+
+        error = self._error + self.process_variance
+        gain = error / (error + self.measurement_variance)
+        self._value += gain * (reading - self._value)
+        self._error = (1 - gain) * error
+        return self._value
+
+    @property
+    def value(self):
+        """The current estimate, or None if there have been no readings"""
+        return self._value
+
+_FILTERS = {
+    MEDIAN: RollingMedian,
+    EWMA: ExponentialMovingAverage,
+    KALMAN: Kalman
+}
+
+def create(config=None):
+    """
+    Creates a filter from config, eg {'type': 'median', 'window': 9}.
+
+    The remaining keys are passed to the filter's constructor.  With no config, a
+    median of the last 3 readings is used.
+    """
+    if not config:
+        return RollingMedian()
+
+    config = dict(config)
+    filter_type = config.pop('type', MEDIAN)
+    try:
+        filter_class = _FILTERS[filter_type]
+    except KeyError:
+        raise ValueError('unknown filter type: %s' % filter_type)
+    return filter_class(**config)
@@ -4,6 +4,7 @@ Script to publish the temperature of the thermocouple attached to the gas heater
 at 40 Stokes Valley Road to AWS IoT
 """
 import logging
+import threading
 import time
 
 from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishTimeoutException
@@ -12,7 +13,9 @@ try:
     import mcp9000
 except ImportError:
     pass
+import config_reload
 import iot
+import ipc
 
 logger = logging.getLogger(__name__) # pylint: disable=invalid-name
 
@@ -20,22 +23,59 @@ class GasSensor(iot.TemperatureSensor):
     """Gas Sensor Controller Class"""
     def __init__(self, config):
         super(GasSensor, self).__init__()
+        self.config = config
         self.iot = None
+        self.local = None
+        self.started = threading.Event()
 
         try:
             mcp9000_config = config['mcp9000']
-            self.mcp9000 = mcp9000.MCP9000(mcp9000_config['bus'], mcp9000_config['address'])
+            self.mcp9000 = mcp9000.MCP9000(mcp9000_config['bus'], mcp9000_config['address'],
+                                           mcp9000_config.get('burst'))
+            if 'ipc' in config:
+                self.local = ipc.Sender(config['ipc'].get('socket', ipc.DEFAULT_SOCKET))
+            self.threshold = config.get('threshold')
+            self.sampling = AdaptiveInterval(threshold=self.threshold,
+                                             **config.get('sampling', {}))
         except KeyError:
             self.threshold = config['threshold']
             self.client_id = config['client_id']
 
     def start(self):
         """Start the controller"""
+        self.iot.on_publish_timeout = self.publish_timeout_callback
+        self.started.set()
         while True:
             temperature = self.mcp9000.temperature
             if temperature:
                 self.temperature = temperature
-            time.sleep(2)
+                interval = self.sampling.update(temperature)
+            else:
+                interval = self.sampling.min_interval
+            time.sleep(interval)
+
+    def reconfigure(self, config):
+        """
+        Applies a changed config in place.
+
+        The threshold and sampling bounds can be changed while running; returns
+        False if anything else changed, and so needs a restart.
+        """
+        changed = config_reload.changed_keys(self.config, config)
+        if changed - set(['threshold', 'sampling', 'logging']):
+            return False
+
+        self.threshold = config.get('threshold')
+        if 'sampling' in changed:
+            self.sampling = AdaptiveInterval(**config.get('sampling', {}))
+        self.sampling.threshold = self.threshold
+        self.config = config
+        return True
+
+    def publish_timeout_callback(self, _topic, _message):
+        """Called when a queued publish could not be sent"""
+        logger.warning('publish timeout')
+        self.iot.reconnect()
 
     @property
     def heater_is_on(self):
@@ -70,6 +110,8 @@ class GasSensor(iot.TemperatureSensor):
         """
         message = {'state': {'reported': {'temperature': self.temperature.value}}}
         logger.debug(message)
+        if self.local:
+            self.local.send(message)
         try:
             self.iot.publish(self.iot.topics['shadow_update'], message)
         except publishTimeoutException:
@@ -77,3 +119,40 @@ class GasSensor(iot.TemperatureSensor):
             self.iot.reconnect()
         except AttributeError:
             pass
+
+class AdaptiveInterval(object):
+    """
+    Chooses how long to wait before the next reading.
+
+    Readings are taken every min_interval while the temperature is changing by
+    more than rate degrees a second, or is within margin of threshold.  Otherwise
+    the interval doubles with each steady reading, up to max_interval.
+    """
+    def __init__(self, min_interval=2, max_interval=30, rate=0.1, margin=5, threshold=None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.rate = rate
+        self.margin = margin
+        self.threshold = threshold
+        self.interval = min_interval
+        self._last = None
+
+    def update(self, temperature, now=None):
+        """Records a reading, returning the interval until the next one"""
+        if now is None:
+            now = time.time()
+
+        urgent = self.threshold is not None and \
+            abs(temperature - self.threshold) <= self.margin
+        if self._last:
+            last_time, last_temperature = self._last
+            elapsed = now - last_time
+            if elapsed > 0 and abs(temperature - last_temperature) / float(elapsed) > self.rate:
+                urgent = True
+        self._last = (now, temperature)
+
+        if urgent:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        return self.interval
@@ -1,7 +1,12 @@
 """Sensor module"""
 import time
 import atexit
-from numpy import median
+import logging
+import threading
+from collections import deque
+
+import filters
+import metrics
 try:
     import RPi.GPIO as GPIO #pylint: disable=import-error
     import Adafruit_DHT #pylint: disable=import-error
@@ -23,6 +28,13 @@ except ImportError:
 ON = 1
 OFF = 0
 
+COLD_START = 'cold_start'
+PRE_WARM = 'pre_warm'
+ALWAYS_ON = 'always_on'
+POWER_MODES = [COLD_START, PRE_WARM, ALWAYS_ON]
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
 class LEDVerify(object):
     """Class for reading the 74HC373N"""
     def __init__(self, le_pin, d0_pin, q0_pin):
@@ -76,13 +88,32 @@ class LEDVerify(object):
             raise IOError('3/3: GPIO State was not LOW)')
 
 class DHT22(object):
-    """DHT22 Sensor class"""
-    def __init__(self, data_pin, onoff_pin):
+    """
+    DHT22 Sensor class
+
+    power_mode controls when the sensor is powered:
+        cold_start: powered on for each sample, paying the full warm up each time
+        pre_warm:   powered on warm_up seconds ahead of the next scheduled sample
+        always_on:  never powered off
+    """
+    def __init__(self, data_pin, onoff_pin, power_mode=COLD_START, warm_up=2,
+                 filter_config=None):
         """Constructor"""
+        if power_mode not in POWER_MODES:
+            raise ValueError('power_mode must be one of %s' % ', '.join(POWER_MODES))
+
         GPIO.setup(onoff_pin, GPIO.OUT)
         self.data_pin = data_pin
         self.onoff_pin = onoff_pin
+        self.power_mode = power_mode
+        self.warm_up = warm_up
         self._sensor_state = OFF
+        self._powered_at = None
+        self._temperature_filter = filters.create(filter_config)
+        self._humidity_filter = filters.create(filter_config)
+
+        if power_mode == ALWAYS_ON:
+            self.sensor_state = ON
 
     @property
     def sensor_state(self):
@@ -99,39 +130,133 @@ class DHT22(object):
 
         GPIO.output(self.onoff_pin, sensor_state)
         self._sensor_state = sensor_state
-        if sensor_state == ON:
-            time.sleep(2)
+        self._powered_at = time.time() if sensor_state == ON else None
 
     @property
+    def pre_warm_lead(self):
+        """How long before a scheduled sample pre_warm should be called"""
+        if self.power_mode == PRE_WARM:
+            return self.warm_up
+        return 0
+
+    def pre_warm(self):
+        """Powers the sensor on without waiting for it to warm up"""
+        self.sensor_state = ON
+
+    def _wait_for_warm_up(self):
+        remaining = self._powered_at + self.warm_up - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    @property
+    @metrics.timer('gpio.dht_read')
     def current_sample(self):
         """Reads the sensor and returns the current samples"""
         old_sensor_state = self.sensor_state
         try:
             self.sensor_state = ON
+            self._wait_for_warm_up()
             return Adafruit_DHT.read_retry(Adafruit_DHT.DHT22, self.data_pin)
         finally:
             self.sensor_state = old_sensor_state
 
     @property
+    @metrics.timer('gpio.dht_sample')
     def sample(self):
         """read the sensor"""
         try:
             # turn on sensor so the sampler doesn't turn it off
             self.sensor_state = ON
-            samples = Samples()
+            self._wait_for_warm_up()
+            samples = Samples(self._temperature_filter, self._humidity_filter)
             tries_remaining = 10
             while tries_remaining > 0 and samples.sample_count < 3:
                 samples.humidity, samples.temperature = self.current_sample
                 tries_remaining = tries_remaining - 1
             return Sample(samples.humidity, samples.temperature)
         finally:
-            self.sensor_state = OFF
+            if self.power_mode != ALWAYS_ON:
+                self.sensor_state = OFF
+
+class Sampler(object):
+    """
+    Samples a sensor on a background thread.
+
+    The most recent samples are kept in a bounded ring buffer, so readers get the
+    newest sample immediately rather than waiting on the sensor.
+    """
+    def __init__(self, sensor, interval=2, size=30):
+        self.sensor = sensor
+        self.interval = interval
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add_listener(self, listener):
+        """Registers a callable to be given each new sample"""
+        self._listeners.append(listener)
+
+    def start(self):
+        """Starts the sampling thread"""
+        if self._thread:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the sampling thread"""
+        self._stopped.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(5)
+        self._thread = None
+
+    @property
+    def latest(self):
+        """The most recent sample, or None if nothing has been sampled yet"""
+        with self._lock:
+            if not self._samples:
+                return None
+            return self._samples[-1]
+
+    @property
+    def samples(self):
+        """The buffered samples, oldest first"""
+        with self._lock:
+            return list(self._samples)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                sample = self.sensor.sample
+            except Exception: # pylint: disable=broad-except
+                logger.exception('could not sample sensor')
+                sample = None
+
+            if sample:
+                with self._lock:
+                    self._samples.append(sample)
+                for listener in self._listeners:
+                    try:
+                        listener(sample)
+                    except Exception: # pylint: disable=broad-except
+                        logger.exception('sample listener %r', listener)
+
+            lead = min(getattr(self.sensor, 'pre_warm_lead', 0), self.interval)
+            if self._stopped.wait(self.interval - lead) or not lead:
+                continue
+            self.sensor.pre_warm()
+            self._stopped.wait(lead)
 
 class Sample(object):
     """Sample class"""
-    def __init__(self, humidity=None, temperature=None):
+    def __init__(self, humidity=None, temperature=None, timestamp=None):
         self._humidity = humidity
         self._temperature = temperature
+        self._timestamp = timestamp if timestamp else time.time()
 
     @property
     def humidity(self):
@@ -143,43 +268,62 @@ class Sample(object):
         """The temperature"""
         return self._temperature
 
+    @property
+    def timestamp(self):
+        """When the sample was taken"""
+        return self._timestamp
+
     def __repr__(self):
-        pattern = '%s(humidity=%r, temperature=%r)'
-        return pattern % (self.__class__.__name__, self.humidity, self.temperature)
+        pattern = '%s(humidity=%r, temperature=%r, timestamp=%r)'
+        return pattern % (self.__class__.__name__,
+                          self.humidity,
+                          self.temperature,
+                          self.timestamp)
 
 class Samples(object):
-    """Samples class"""
-    def __init__(self):
-        self._temperature = []
-        self._humidity = []
+    """
+    Samples class
+
+    Readings are fed through streaming filters, which may carry history over from
+    previous Samples.
+    """
+    def __init__(self, temperature_filter=None, humidity_filter=None):
+        self._temperature_filter = temperature_filter or filters.create()
+        self._humidity_filter = humidity_filter or filters.create()
+        self._temperature_count = 0
+        self._humidity_count = 0
 
     @property
     def sample_count(self):
         """Minimum number of samples collected"""
-        return min(len(self._temperature), len(self._humidity))
+        return min(self._temperature_count, self._humidity_count)
 
     @property
     def temperature(self):
-        """Average temperature"""
-        if not self._temperature:
+        """Filtered temperature"""
+        if not self._temperature_count:
             return None
 
-        return round(median(self._temperature), 1)
+        return round(self._temperature_filter.value, 1)
 
     @property
     def humidity(self):
-        """Average humidity"""
-        if not self._humidity:
+        """Filtered humidity"""
+        if not self._humidity_count:
             return None
 
-        return round(median(self._humidity), 1)
+        return round(self._humidity_filter.value, 1)
 
     @temperature.setter
     def temperature(self, temperature):
         if temperature is not None:
-            self._temperature.append(temperature)
+            with metrics.timed('gpio.filter'):
+                self._temperature_filter.update(temperature)
+            self._temperature_count += 1
 
     @humidity.setter
     def humidity(self, humidity):
         if humidity is not None:
-            self._humidity.append(humidity)
+            with metrics.timed('gpio.filter'):
+                self._humidity_filter.update(humidity)
+            self._humidity_count += 1
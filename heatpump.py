@@ -1,7 +1,10 @@
 """Heatpump module"""
-import subprocess
+import bisect
 import logging
 
+import lirc
+import metrics
+
 _A = 'action'
 _C = 'command'
 _T = 'trend'
@@ -10,6 +13,8 @@ START_COOLING = {_A: 'cooling', _C: 'maxcold', _T: 1}
 SHUTDOWN = {_A: 'shutdown', _C: 'stokesoff', _T: 0}
 START_HEATING = {_A: 'heating', _C: 'stokesheat', _T: -1}
 
+ACTIONS = dict((command[_A], command) for command in [START_COOLING, SHUTDOWN, START_HEATING])
+
 H1 = 'heating_start'
 H0 = 'heating_stop'
 C0 = 'cooling_stop'
@@ -20,16 +25,26 @@ _BACKWARDS = '%s needs to be less than %s'
 
 logger = logging.getLogger(__name__) # pylint: disable=invalid-name
 
+def _bounds(breakpoints, index):
+    return (breakpoints[index - 1] if index > 0 else None,
+            breakpoints[index] if index < len(breakpoints) else None)
+
 class Heatpump(object):
     """Heatpump class"""
-    def __init__(self):
+    def __init__(self, remote='heat_pump'):
+        self.remote = remote
         self._setpoints = {H1: None,
                            H0: None,
                            C0: None,
                            C1: None}
         self._current_action = None
         self.led_verify = None
+        self.lirc = lirc.LircClient()
         self._heater = None
+        # (breakpoints, regions), replaced as a whole so get_action never sees
+        # the breakpoints of one set of setpoints with the regions of another
+        self._table = ([], [])
+        self._compile()
 
     @property
     def setpoints(self):
@@ -41,6 +56,11 @@ class Heatpump(object):
         """Returns what the heatpump is supposed to be doing currently"""
         return self._current_action
 
+    @current_action.setter
+    def current_action(self, current_action):
+        """Sets what the heatpump is doing, as when restoring a checkpoint"""
+        self._current_action = current_action
+
     @setpoints.setter
     def setpoints(self, setpoints):
         """Updates the setpoints"""
@@ -58,6 +78,7 @@ class Heatpump(object):
                 raise ValueError(_BACKWARDS % params)
 
         self._setpoints = target
+        self._compile()
 
     @property
     def heater(self):
@@ -69,13 +90,51 @@ class Heatpump(object):
         """Sets the gas_sensor"""
         self._heater = heater
 
+    @metrics.timer('heatpump.get_action')
     def get_action(self, temperature):
         """Computes the action to take based on the current temperature"""
-        if self._is_hot(temperature):
-            if self._heater_on():
-                logger.debug('heater is on, not cooling')
-            else:
-                return START_COOLING
+        breakpoints, regions = self._table
+        index = bisect.bisect_left(breakpoints, temperature)
+        if index < len(breakpoints) and breakpoints[index] == temperature:
+            action, heater_on_action = regions[2 * index + 1]
+        else:
+            action, heater_on_action = regions[2 * index]
+
+        if action is START_COOLING and self._heater_on():
+            logger.debug('heater is on, not cooling')
+            action = heater_on_action
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('%s between %s: %s', temperature, _bounds(breakpoints, index),
+                         action[_A] if action else None)
+        return action
+
+    def _compile(self):
+        """
+        Precomputes the action for each region of the temperature scale.
+
+        The setpoints split the scale into open intervals and the setpoints
+        themselves; the regions hold the action for each, alternating interval,
+        setpoint, interval, ..., interval.  Each entry also holds the action to
+        take instead of cooling when the heater is on.
+        """
+        breakpoints = sorted(set(value for value in self._setpoints.values()
+                                 if value is not None))
+        probes = []
+        below = breakpoints[0] - 1 if breakpoints else 0
+        for breakpoint in breakpoints:
+            probes.append((below + breakpoint) / 2.0)
+            probes.append(breakpoint)
+            below = breakpoint
+        probes.append(below + 1)
+
+        regions = [(self._decide(probe, False), self._decide(probe, True))
+                   for probe in probes]
+        self._table = (breakpoints, regions)
+
+    def _decide(self, temperature, heater_on):
+        if self._is_hot(temperature) and not heater_on:
+            return START_COOLING
 
         if self._is_cold(temperature):
             return START_HEATING
@@ -85,37 +144,31 @@ class Heatpump(object):
 
         return None
 
+    @metrics.timer('heatpump.send_command')
     def send_command(self, command):
         """sends a command to the heatpump"""
-        self.led_verify.reset()
-        if subprocess.call(["irsend", "SEND_ONCE", "heat_pump", command[_C]]) == 0:
-            if self.led_verify.state:
-                self._current_action = command
-                return command
+        # the LEDs are verified by latching, so nothing else may fire them until
+        # the latch has been read
+        with self.lirc.lock:
+            with metrics.timed('heatpump.led_verify'):
+                self.led_verify.reset()
+            with metrics.timed('heatpump.ir_send'):
+                sent = self.lirc.send_once(self.remote, command[_C])
+            if sent:
+                if self.led_verify.state:
+                    self._current_action = command
+                    return command
 
         raise IOError()
 
     def _is_hot(self, temperature):
-        logger.debug('%s > %s: is_hot: %r',
-                     temperature,
-                     self._setpoints[C1],
-                     temperature > self._setpoints[C1])
         return self._has_cooling() and temperature > self._setpoints[C1]
 
     def _is_cold(self, temperature):
-        logger.debug('%s < %s: is_cold: %r',
-                     temperature,
-                     self._setpoints[H1],
-                     temperature < self._setpoints[H1])
         return self._has_heating() and temperature < self._setpoints[H1]
 
     def _is_shutdown(self, temperature):
         if self._has_full_config():
-            logger.debug('%s < %s < %s: is_shutdown: %r',
-                         self._setpoints[H0],
-                         temperature,
-                         self._setpoints[C0],
-                         temperature > self._setpoints[H0] and temperature < self._setpoints[C0])
             return temperature > self._setpoints[H0] and temperature < self._setpoints[C0]
 
         if self._has_heating() and temperature > self._setpoints[H0]:
@@ -28,15 +28,23 @@ V2 board:
 
 """
 import logging
+import threading
 import time
-from copy import deepcopy
+import Queue
 
 from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishTimeoutException
 
+import checkpoint
 import heatpump
 import gpio
 import iot
 import gas_sensor
+import config_reload
+import ipc
+import lirc
+import metrics
+import reporting
+import startup
 
 DEFAULT_SETPOINTS = {
     heatpump.H1: 16,
@@ -45,49 +53,302 @@ DEFAULT_SETPOINTS = {
     heatpump.C1: 24
 }
 
+_SAMPLE = 'sample'
+_DESIRED = 'desired'
+
+# settings which belong to a single zone, and are not shared with the others
+_ZONE_ONLY = ['zones', 'thing', 'history', 'metrics', 'checkpoint']
+
+# settings which reconfigure can change without a restart
+_RELOADABLE = ['default_setpoints', 'reporting', 'gas_sensor', 'logging']
+
 logger = logging.getLogger(__name__) # pylint: disable=invalid-name
 
 class HeatpumpController(object):
     """Main Class"""
     def __init__(self, config):
+        self.config = config
         self.iot = None
+        self.watch_gas_sensor = True
+        self.gas_listener = None
+        self.gas_local_max_age = 120
+        self._gas_local_update = None
         self._state = State()
+        self.sample_interval = config.get('sample_interval', 2)
+        self.reporting = reporting.ReportingPolicy(config.get('reporting'))
+
+        self.metrics_writer = None
+        if 'metrics' in config:
+            metrics_config = config['metrics']
+            self.metrics_writer = metrics.Writer(
+                metrics.REGISTRY,
+                metrics_config.get('interval', 60),
+                metrics_config.get('path'),
+                self.send_metrics if metrics_config.get('report') else None)
+
+        self.history = None
+        if 'history' in config:
+            # history needs numpy, which is slow to import on a Pi
+            import history
+            history_config = config['history']
+            self.history = history.History(history_config['path'],
+                                           history_config.get('capacity', 100000))
+
+        self._stopped = threading.Event()
+        self.started = threading.Event()
+        self._decisions = Queue.Queue()
+        self._reports = Queue.Queue(maxsize=1)
+        # process_state and send_sample both read and update self.state
+        self._state_lock = threading.Lock()
+        self._workers = []
 
         dht_config = config['dht']
-        self.dht22 = gpio.DHT22(dht_config['data_pin'], dht_config['onoff_pin'])
+        self.dht22 = gpio.DHT22(dht_config['data_pin'],
+                                dht_config['onoff_pin'],
+                                dht_config.get('power_mode', gpio.COLD_START),
+                                dht_config.get('warm_up', 2),
+                                dht_config.get('filter'))
+        self.sampler = gpio.Sampler(self.dht22,
+                                    self.sample_interval,
+                                    dht_config.get('buffer_size', 30))
+        self.sampler.add_listener(self._on_sample)
+        self.max_sample_age = dht_config.get('max_sample_age', 60)
 
         led_verify_config = config['led_verify']
         led_verify = gpio.LEDVerify(led_verify_config['le_pin'],
                                     led_verify_config['d0_pin'],
                                     led_verify_config['q0_pin'])
 
-        self.heatpump = heatpump.Heatpump()
+        self.heatpump = heatpump.Heatpump(config.get('remote', 'heat_pump'))
         self.heatpump.setpoints = config['default_setpoints']
         self.heatpump.led_verify = led_verify
 
+        lirc_config = config.get('lirc', {})
+        self.heatpump.lirc = lirc.LircClient(lirc_config.get('socket', lirc.DEFAULT_SOCKET))
+
         try:
             gas_sensor_config = config['gas_sensor']
             self.gas_sensor = gas_sensor.GasSensor(gas_sensor_config)
             self.heatpump.heater = self.gas_sensor
         except KeyError:
             pass
+        else:
+            ipc_config = gas_sensor_config.get('ipc')
+            if ipc_config:
+                self.gas_listener = ipc.Listener(
+                    ipc_config.get('socket', ipc.DEFAULT_SOCKET),
+                    self.local_gas_heater_state)
+                self.gas_local_max_age = ipc_config.get('max_age', 120)
+
+        self.checkpointer = None
+        if 'checkpoint' in config:
+            checkpoint_config = config['checkpoint']
+            self.checkpointer = checkpoint.Checkpointer(checkpoint_config['path'],
+                                                        self.snapshot,
+                                                        checkpoint_config.get('interval', 30))
+            self.restore(checkpoint.load(checkpoint_config['path']),
+                         checkpoint_config.get('max_age', 600))
 
     def start(self):
         """Starts the controller"""
-        self.heatpump.led_verify.self_test()
-        self.subscribe()
-        self.send_set_points()
+        with startup.phase('self_test'):
+            self.heatpump.led_verify.self_test()
+        self.prepare()
+        self.started.set()
         time.sleep(10)
         self.iot.publish(self.gas_sensor.topics['get_state'], '')
 
+        self.start_workers()
+        try:
+            while not self._stopped.is_set():
+                self._stopped.wait(1)
+        finally:
+            self.stop()
+
+    def reconfigure(self, config):
+        """
+        Applies a changed config in place.
+
+        Setpoints, the reporting policy and the gas heater threshold can be
+        changed while running; returns False if anything else changed, and so
+        needs a restart.
+        """
+        changed = config_reload.changed_keys(self.config, config)
+        if changed - set(_RELOADABLE):
+            return False
+        if 'gas_sensor' in changed:
+            old_gas, new_gas = self.config.get('gas_sensor'), config.get('gas_sensor')
+            if not old_gas or not new_gas or \
+                    config_reload.changed_keys(old_gas, new_gas) - set(['threshold']):
+                return False
+
+        if 'default_setpoints' in changed:
+            self.heatpump.setpoints = config['default_setpoints']
+            logger.info('setpoints now %s', self.heatpump.setpoints)
+            if self.iot:
+                self.send_set_points()
+        if 'reporting' in changed:
+            self.reporting = reporting.ReportingPolicy(config.get('reporting'))
+        if 'gas_sensor' in changed:
+            self.gas_sensor.threshold = config['gas_sensor']['threshold']
+        self.config = config
+        return True
+
+    def prepare(self):
+        """Sets up MQTT subscriptions and reports the set points"""
+        self.iot.on_publish_timeout = self.publish_timeout_callback
+        self.subscribe()
+        if self.gas_listener and self.watch_gas_sensor:
+            if not self.gas_listener.start():
+                logger.warning('gas heater readings will only arrive by MQTT')
+        self.send_set_points()
+
+    def start_workers(self):
+        """
+        Starts the sampling, decision and reporting threads.
+
+        Sampling and incoming desired state feed the decision queue, and each
+        sample is passed on to the reporting queue once it has been decided on,
+        so a slow sensor read, IR send or publish only holds up its own stage.
+        """
+        self._stopped.clear()
+        for target in [self._decision_loop, self._report_loop]:
+            worker = threading.Thread(target=target, name=target.__name__.strip('_'))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        self.sampler.start()
+        if self.metrics_writer:
+            self.metrics_writer.start()
+        if self.checkpointer:
+            self.checkpointer.start()
+
+    def stop(self):
+        """Stops the worker threads"""
+        self._stopped.set()
+        self.sampler.stop()
+        if self.gas_listener:
+            self.gas_listener.stop()
+        if self.metrics_writer:
+            self.metrics_writer.stop()
+        self._decisions.put(None)
+        _offer(self._reports, None)
+        for worker in self._workers:
+            if worker is not threading.current_thread():
+                worker.join(5)
+        self._workers = []
+        if self.checkpointer:
+            self.checkpointer.stop()
+        self.heatpump.lirc.close()
+        if self.history is not None:
+            self.history.flush()
+
+    def snapshot(self):
+        """The state worth keeping over a restart, for checkpointing"""
+        gas_temperature = None
+        try:
+            gas_temperature = _dump_item(self.gas_sensor.temperature)
+        except AttributeError:
+            pass
+
+        action = self.heatpump.current_action
+        return {'temperature': _dump_item(self.state.temperature),
+                'humidity': _dump_item(self.state.humidity),
+                'function': self.state.function,
+                'action': action['action'] if action else None,
+                'setpoints': self.heatpump.setpoints,
+                'default_setpoints': self.config.get('default_setpoints'),
+                'gas_temperature': gas_temperature}
+
+    def restore(self, snapshot, max_age=600):
+        """
+        Restores a snapshot saved before a restart.
+
+        Readings are only restored if they are less than max_age seconds old,
+        and the setpoints and what the heatpump was doing only if the snapshot
+        is.  The setpoints are also only restored if default_setpoints hasn't
+        changed since the snapshot, so edits to config.yaml win.
+        """
+        if not snapshot:
+            return
+
+        now = time.time()
+        function = None
+        fresh = _is_fresh(snapshot.get('saved'), now, max_age)
+        if fresh and snapshot.get('default_setpoints') == self.config.get('default_setpoints'):
+            try:
+                self.heatpump.setpoints = snapshot['setpoints']
+            except (KeyError, TypeError, ValueError) as error:
+                logger.warning('not restoring setpoints: %s', error)
+        if fresh:
+            self.heatpump.current_action = heatpump.ACTIONS.get(snapshot.get('action'))
+            function = snapshot.get('function')
+        self._state = State(_load_item(snapshot.get('humidity'), now, max_age),
+                            _load_item(snapshot.get('temperature'), now, max_age),
+                            function)
+
+        gas_temperature = _load_item(snapshot.get('gas_temperature'), now, max_age)
+        if gas_temperature and hasattr(self, 'gas_sensor'):
+            self.gas_sensor._temperature = gas_temperature # pylint: disable=protected-access
+        logger.info('restored %s', snapshot)
+
+    def _on_sample(self, environment_state):
+        logger.debug('sample: %r', environment_state)
+        self.record(environment_state)
+        if environment_state.temperature and environment_state.humidity:
+            self._decisions.put((_SAMPLE, environment_state))
+
+    def _decision_loop(self):
+        latest_sample = None
         while True:
-            environment_state = self.environment
-            current_state = self.state
-            if environment_state and current_state:
-                if environment_state.temperature and environment_state.humidity:
-                    self.process_state(environment_state)
+            events = [self._decisions.get()]
+            while True:
+                try:
+                    events.append(self._decisions.get_nowait())
+                except Queue.Empty:
+                    break
+
+            if None in events:
+                return
+
+            # only the newest sample matters, but every desired state is applied
+            # in the order it arrived
+            new_sample = None
+            sampled = False
+            for kind, payload in events:
+                if kind == _DESIRED:
+                    self.apply_desired_state(payload)
+                    new_sample = new_sample or latest_sample
+                else:
+                    new_sample = payload
+                    sampled = True
+
+            if new_sample and self._is_stale(new_sample):
+                # the sensor has stopped producing samples; don't act on old ones
+                latest_sample = new_sample = None
+                sampled = False
+            if new_sample:
+                latest_sample = new_sample
+                try:
+                    with self._state_lock:
+                        self.process_state(new_sample)
+                except Exception: # pylint: disable=broad-except
+                    logger.exception('could not process state')
+            # process_state compares the sample with the last reported state, so
+            # the sample is only reported once it has been decided on
+            if sampled:
+                _offer(self._reports, new_sample)
+
+    def _report_loop(self):
+        while True:
+            environment_state = self._reports.get()
+            if environment_state is None:
+                return
+            try:
+                with self._state_lock:
                     self.send_sample(environment_state)
-            time.sleep(2)
+            except Exception: # pylint: disable=broad-except
+                logger.exception('could not send sample')
 
     def subscribe(self):
         """Set up MQTT subscriptions"""
@@ -98,12 +359,14 @@ class HeatpumpController(object):
         self.iot.subscribe(
             self.iot.topics['update_state'],
             self.update_state_callback)
+        if not self.watch_gas_sensor:
+            return
         self.iot.subscribe(
             self.gas_sensor.topics['update_document'],
-            self.update_gas_heater_state)
+            self.cloud_gas_heater_state)
         self.iot.subscribe(
             self.gas_sensor.topics['get_state_accepted'],
-            self.update_gas_heater_state)
+            self.cloud_gas_heater_state)
 
     def update_gas_heater_state(self, _client, _userdata, message):
         """Callback to process a new state update from the gas_sensor"""
@@ -113,6 +376,28 @@ class HeatpumpController(object):
             current_state = message
         self.gas_sensor.temperature = current_state['state']['reported']['temperature']
 
+    def local_gas_heater_state(self, client, userdata, message):
+        """Callback for a state update sent directly by the gas_sensor"""
+        self._gas_local_update = time.time()
+        self.update_gas_heater_state(client, userdata, message)
+
+    def cloud_gas_heater_state(self, client, userdata, message):
+        """
+        Callback for a state update from the gas_sensor's shadow.
+
+        Ignored while the gas_sensor is updating us directly, as the shadow lags
+        behind and may be replaying readings spooled during an outage.
+        """
+        if self._gas_local_update is not None and \
+                time.time() - self._gas_local_update < self.gas_local_max_age:
+            return
+        self.update_gas_heater_state(client, userdata, message)
+
+    def publish_timeout_callback(self, _topic, _message):
+        """Called when a queued publish could not be sent"""
+        logger.warning('publish timeout, clearing local state')
+        self.state.reset()
+
     def shadow_update_rejected_callback(self, _client, _userdata, _message):
         """State update rejected callback function"""
         logger.warning("State update rejected")
@@ -123,6 +408,13 @@ class HeatpumpController(object):
         logger.debug("Received new desired state:")
         logger.debug(message)
 
+        if self._workers:
+            self._decisions.put((_DESIRED, message))
+        else:
+            self.apply_desired_state(message)
+
+    def apply_desired_state(self, message):
+        """Applies a desired state change and reports the resulting setpoints"""
         try:
             desired_state = message['state']
         except KeyError as error:
@@ -143,6 +435,7 @@ class HeatpumpController(object):
             logger.warning('publish timeout, clearing local state')
             self.state.reset()
 
+    @metrics.timer('heatpump_controller.process_state')
     def process_state(self, new_state):
         """
         Determines the action to take based on the new_state, and takes it.
@@ -155,7 +448,8 @@ class HeatpumpController(object):
         heatpump_command = self.heatpump.get_action(new_state.temperature)
 
         try:
-            logger.debug('gs: %s', str(self.gas_sensor.heater_is_on))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('gs: %s', self.gas_sensor.heater_is_on)
         except AttributeError:
             pass
 
@@ -195,6 +489,37 @@ class HeatpumpController(object):
             logger.warning('publish timeout, clearing local state')
             self.state.reset()
 
+    def record(self, environment):
+        """
+        Records a sample and the current action in the local history.
+
+        Only the sampler records, once per sample, so the timestamps stay in
+        order; a change of action shows up with the next sample.
+        """
+        if self.history is None:
+            return
+
+        gas_temperature = None
+        try:
+            gas_temperature = self.gas_sensor.temperature.value
+        except AttributeError:
+            pass
+
+        action = self.heatpump.current_action
+        self.history.append(environment.timestamp,
+                            environment.temperature,
+                            environment.humidity,
+                            gas_temperature,
+                            action['action'] if action else None)
+
+    def send_metrics(self, summary):
+        """Reports a summary of the stage timings to IoT"""
+        message = {'state': {'reported': {'metrics': summary}}}
+        try:
+            self.iot.publish(self.iot.topics['shadow_update'], message)
+        except publishTimeoutException:
+            logger.warning('publish timeout sending metrics')
+
     def send_set_points(self):
         """Send set points to IoT"""
         message = {
@@ -216,33 +541,28 @@ class HeatpumpController(object):
 
     @property
     def environment(self):
-        """Obtains a sample from the sensor"""
-        sample = self.dht22.sample
-        logger.debug('sample: %r', sample)
+        """The newest sample from the sensor, or None if it is too old"""
+        sample = self.sampler.latest
+        if sample and self._is_stale(sample):
+            return None
         return sample
 
-    def compute_state_difference(self, new_state):
-        """Computes the difference between the current state and the new state"""
-        if not self.state.temperature and not self.state.humidity:
-            return new_state
+    def _is_stale(self, sample):
+        if sample.timestamp + self.max_sample_age < time.time():
+            logger.warning('stale sample: %r', sample)
+            return True
+        return False
 
-        new_state = deepcopy(new_state)
-        if self.state.temperature:
-            try:
-                if abs(self.state.temperature.value - new_state['temperature']) < 0.2:
-                    del new_state['temperature']
-            except KeyError:
-                pass
-
-        if self.state.humidity:
-            try:
-                if abs(self.state.humidity.value - new_state['humidity']) < 0.2:
-                    del new_state['humidity']
-            except KeyError:
-                pass
-
-        return new_state
+    def compute_state_difference(self, new_state, now=None):
+        """
+        Computes the difference between the current state and the new state,
+        according to the reporting policy.
+        """
+        reported = {'temperature': self.state.temperature,
+                    'humidity': self.state.humidity}
+        return self.reporting.difference(reported, new_state, now or time.time())
 
+    @metrics.timer('heatpump_controller.send_sample')
     def send_sample(self, environment):
         """
         Determines the difference in the environment state and sends those
@@ -252,11 +572,7 @@ class HeatpumpController(object):
                      'humidity': environment.humidity}
 
         now = time.time()
-        different_state = self.compute_state_difference(new_state)
-        if not self.state.last_update or self.state.last_update + 60 < now:
-            reported_state = new_state
-        else:
-            reported_state = different_state
+        reported_state = self.compute_state_difference(new_state, now)
 
         try:
             self.state.temperature = reported_state['temperature']
@@ -268,11 +584,10 @@ class HeatpumpController(object):
         except KeyError:
             pass
 
-        logger.debug('last_update: %s, now: %s, t: %s, h: %s',
-                     str(now),
-                     str(self.state.last_update),
-                     str(environment.temperature),
-                     str(environment.humidity))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('last_update: %s, now: %s, t: %s, h: %s', now,
+                         self.state.last_update, environment.temperature,
+                         environment.humidity)
 
         if not reported_state:
             return None
@@ -287,6 +602,147 @@ class HeatpumpController(object):
 
         return reported_state
 
+class MultiZoneController(object):
+    """
+    Runs several zones in one process.
+
+    Each zone has its own DHT22, setpoints, IR remote and shadow, and is
+    configured by an entry in zones, which overrides the settings shared by all
+    zones.  The IR emitter, LED verify, gas sensor and MQTT connection are
+    shared.
+    """
+    def __init__(self, config):
+        self._iot = None
+        self._stopped = threading.Event()
+        self.started = threading.Event()
+        self._things = []
+        self.zones = []
+
+        for zone_config in _zone_configs(config):
+            zone = HeatpumpController(zone_config)
+            if self.zones:
+                first = self.zones[0]
+                zone.heatpump.led_verify = first.heatpump.led_verify
+                zone.heatpump.lirc = first.heatpump.lirc
+                if hasattr(first, 'gas_sensor'):
+                    zone.gas_sensor = first.gas_sensor
+                    zone.heatpump.heater = first.gas_sensor
+                zone.watch_gas_sensor = False
+            self.zones.append(zone)
+            self._things.append(zone_config.get('thing'))
+
+    @property
+    def iot(self):
+        """The shared IoT connection"""
+        return self._iot
+
+    @iot.setter
+    def iot(self, connection):
+        self._iot = connection
+        for zone, thing in zip(self.zones, self._things):
+            if thing != connection.client_id:
+                zone.iot = connection.thing(thing)
+            else:
+                zone.iot = connection
+
+    def start(self):
+        """Starts every zone"""
+        first = self.zones[0]
+        with startup.phase('self_test'):
+            first.heatpump.led_verify.self_test()
+        for zone in self.zones:
+            zone.prepare()
+        self.started.set()
+        time.sleep(10)
+        self.iot.publish(first.gas_sensor.topics['get_state'], '')
+
+        self._stopped.clear()
+        for zone in self.zones:
+            zone.start_workers()
+        try:
+            while not self._stopped.is_set():
+                self._stopped.wait(1)
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Stops every zone"""
+        self._stopped.set()
+        for zone in self.zones:
+            zone.stop()
+
+    def reconfigure(self, config):
+        """Applies a changed config to each zone, returning False if it needs a restart"""
+        zone_configs = _zone_configs(config)
+        if len(zone_configs) != len(self.zones):
+            return False
+        applied = [zone.reconfigure(zone_config)
+                   for zone, zone_config in zip(self.zones, zone_configs)]
+        return all(applied)
+
+def _zone_configs(config):
+    """
+    Each zone's config: the shared settings, overridden by the zone's own.
+
+    Every zone must name its own thing, as zones sharing a shadow would
+    overwrite each other's reported state.
+    """
+    shared = dict((key, value) for key, value in config.items()
+                  if key not in _ZONE_ONLY)
+    zone_configs = []
+    things = set()
+    for index, zone_config in enumerate(config['zones']):
+        thing = zone_config.get('thing')
+        if not thing:
+            raise ValueError('zone %d needs a thing' % index)
+        if thing in things:
+            raise ValueError('zones share the thing %s' % thing)
+        things.add(thing)
+        zone_config = dict(shared, **zone_config)
+        if not zone_configs and 'metrics' in config:
+            zone_config['metrics'] = config['metrics']
+        zone_configs.append(zone_config)
+    return zone_configs
+
+def create(config):
+    """Creates the controller for config: multi-zone if it has zones"""
+    if 'zones' in config:
+        return MultiZoneController(config)
+    return HeatpumpController(config)
+
+def _dump_item(item):
+    """A DataItem as a dict, for a checkpoint"""
+    if not item:
+        return None
+    return {'value': item.value,
+            'last_update': item.last_update,
+            'previous_value': item.previous_value,
+            'trend': item.trend}
+
+def _load_item(data, now, max_age):
+    """A DataItem from a checkpoint, or None if it is missing or too old"""
+    if not data or not _is_fresh(data.get('last_update'), now, max_age):
+        return None
+    try:
+        return iot.DataItem(**data)
+    except (TypeError, ValueError):
+        return None
+
+def _is_fresh(timestamp, now, max_age):
+    return timestamp is not None and now - timestamp < max_age
+
+def _offer(queue, item):
+    """Puts item on a bounded queue, discarding the oldest entry if it is full"""
+    while True:
+        try:
+            queue.put_nowait(item)
+            return
+        except Queue.Full:
+            try:
+                queue.get_nowait()
+            except Queue.Empty:
+                pass
+
 class State(iot.TemperatureSensor):
     """Holds the current state"""
     def __init__(self, humidity=None, temperature=None, function=None):
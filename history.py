@@ -0,0 +1,131 @@
+"""
+On-device history of samples and heat pump actions.
+
+Records are fixed size and kept in a memory-mapped ring file, so appending never
+reallocates, history survives restarts, and records can be read as NumPy views
+straight onto the file.
+"""
+import os
+import threading
+
+import numpy
+
+MAGIC = 'HPHIST01'
+
+HEADER = numpy.dtype([('magic', 'S8'),
+                      ('capacity', '<u8'),
+                      ('count', '<u8'),
+                      ('next', '<u8')])
+
+RECORD = numpy.dtype([('timestamp', '<f8'),
+                      ('temperature', '<f4'),
+                      ('humidity', '<f4'),
+                      ('gas_temperature', '<f4'),
+                      ('action', '<i4')])
+
+ACTIONS = [None, 'cooling', 'shutdown', 'heating']
+
+def encode_action(action):
+    """The stored code for a heat pump action name"""
+    return ACTIONS.index(action)
+
+def decode_action(code):
+    """The heat pump action name for a stored code"""
+    return ACTIONS[code]
+
+class History(object):
+    """Memory-mapped ring file of samples and actions"""
+    def __init__(self, path, capacity=100000):
+        if not os.path.exists(path):
+            _create(path, capacity)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = numpy.memmap(path, dtype=numpy.uint8, mode='r+')
+        self._header = self._file[:HEADER.itemsize].view(HEADER)
+        self._records = self._file[HEADER.itemsize:].view(RECORD)
+
+        if self._header['magic'][0] != MAGIC:
+            raise ValueError('%s is not a history file' % path)
+        if len(self._records) != self.capacity:
+            raise ValueError('%s is truncated' % path)
+
+    @property
+    def capacity(self):
+        """The number of records the file can hold"""
+        return int(self._header['capacity'][0])
+
+    def __len__(self):
+        return int(self._header['count'][0])
+
+    def append(self, timestamp, temperature=None, humidity=None,
+               gas_temperature=None, action=None):
+        """
+        Appends a record, overwriting the oldest once the file is full.
+
+        Timestamps must not go backwards, as since searches them in order.
+        """
+        with self._lock:
+            index = int(self._header['next'][0])
+            self._records[index] = (timestamp,
+                                    _nan_if_none(temperature),
+                                    _nan_if_none(humidity),
+                                    _nan_if_none(gas_temperature),
+                                    encode_action(action))
+            # the header is updated after the record, so a crash part way through
+            # loses at most the record being written
+            self._header['next'] = (index + 1) % self.capacity
+            self._header['count'] = min(len(self) + 1, self.capacity)
+
+    def views(self):
+        """
+        The records, oldest first, as up to two views onto the file.
+
+        There are two views once the ring has wrapped around.  The views are not
+        copies, so they change as records are appended.
+        """
+        count = len(self)
+        index = int(self._header['next'][0])
+        if count < self.capacity:
+            return (self._records[:count],)
+        return (self._records[index:], self._records[:index])
+
+    def since(self, timestamp):
+        """
+        The records at or after timestamp, oldest first.
+
+        This is a view onto the file unless the records selected run past the
+        end of the file back to its start, when they are copied into one array.
+        """
+        selected = []
+        for view in self.views():
+            start = numpy.searchsorted(view['timestamp'], timestamp)
+            if start < len(view):
+                selected.append(view[start:])
+        if len(selected) == 1:
+            return selected[0]
+        if not selected:
+            return self._records[:0]
+        return numpy.concatenate(selected)
+
+    def flush(self):
+        """Flushes changes to disk"""
+        self._file.flush()
+
+    def close(self):
+        """Flushes and unmaps the file"""
+        self.flush()
+        del self._header
+        del self._records
+        del self._file
+
+def _nan_if_none(value):
+    return numpy.nan if value is None else value
+
+def _create(path, capacity):
+    header = numpy.zeros(1, HEADER)
+    header['magic'] = MAGIC
+    header['capacity'] = capacity
+    with open(path, 'wb') as history_file:
+        history_file.write(header.tobytes())
+        history_file.truncate(HEADER.itemsize + capacity * RECORD.itemsize)
@@ -1,10 +1,17 @@
 """IoT Module"""
+import collections
 import time
 import logging
-import json
+import threading
+import Queue
 
 from AWSIoTPythonSDK.MQTTLib import AWSIoTMQTTClient
 from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishTimeoutException
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishQueueDisabledException
+
+import codec
+import metrics
+import spool
 
 logger = logging.getLogger(__name__) # pylint: disable=invalid-name
 
@@ -26,17 +33,106 @@ def topics(thing):
     }
 
 
-class IoT(object):
-    """Class to interact with AWS IoT"""
-    def __init__(self, client_id):
-        self.client_id = client_id
-        self.mqtt_client = None
+class _Shadow(object):
+    """Publishing to a thing's shadow, coalescing reported state if asked to"""
+    client_id = None
+    on_publish_timeout = None
+    _coalescer = None
 
     @property
     def topics(self):
         """The topics for this thing"""
         return topics(self.client_id)
 
+    def start_coalescing(self, window):
+        """
+        Merges reported state published to this thing's shadow within window
+        seconds into a single shadow update.
+        """
+        self._coalescer = ShadowCoalescer(window, self._publish_reported)
+
+    def stop_coalescing(self):
+        """Publishes anything pending and stops coalescing shadow updates"""
+        coalescer, self._coalescer = self._coalescer, None
+        if coalescer:
+            coalescer.flush()
+
+    def publish(self, topic, message):
+        """
+        wrapper around mqtt publish
+
+        Returns a PublishFuture which is resolved once the message has been
+        published or spooled, or failed if it times out or is dropped.
+        Coalesced updates share the future of the merged update.
+        """
+        if self._coalescer and topic == self.topics['shadow_update']:
+            if _is_reported_only(message):
+                return self._coalescer.add(message['state']['reported'])
+
+        return self._send(topic, message)
+
+    def _send(self, topic, message, future=None):
+        if _is_reported_only(message):
+            message = codec.encode_reported(message['state']['reported'], self.client_id)
+        elif not isinstance(message, str):
+            message['state']['reported']['thing'] = self.client_id
+            message = codec.dumps(message)
+        future = future or PublishFuture()
+        self._enqueue(topic, message, self._publish_timed_out, future)
+        return future
+
+    def _enqueue(self, topic, message, on_timeout, future):
+        raise NotImplementedError
+
+    def _publish_reported(self, reported, future=None):
+        topic = self.topics['shadow_update']
+        message = {'state': {'reported': reported}}
+        try:
+            self._send(topic, message, future)
+        except publishTimeoutException:
+            self._publish_timed_out(topic, message)
+
+    def _publish_timed_out(self, topic, message):
+        logger.warning('publish timeout on %s', topic)
+        if self.on_publish_timeout:
+            self.on_publish_timeout(topic, message)
+
+class IoT(_Shadow):
+    """Class to interact with AWS IoT"""
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.mqtt_client = None
+        self.on_publish_timeout = None
+        self.retry_interval = 1
+        self.max_retry_interval = 30
+        self.retries = 3
+        self._outbound = None
+        self._publisher = None
+        self._stopped = threading.Event()
+        self._coalescer = None
+        self._things = []
+        self._spool = None
+        self._online = threading.Event()
+        self._drain = threading.Event()
+        self._draining = threading.Event()
+        self._superseded = {}
+        self._superseded_lock = threading.Lock()
+        self.drain_rate = 10
+        self.dispatcher = None
+
+    def thing(self, client_id):
+        """
+        Another thing, published and subscribed through this connection.
+
+        The thing shares this connection's publish queue and spool, and coalesces
+        its shadow updates if this connection does.
+        """
+        thing = Thing(self, client_id)
+        if self._coalescer:
+            thing.start_coalescing(self._coalescer.window)
+        self._things.append(thing)
+        return thing
+
     def connect(self, host, credentials):
         """Connect to the IoT service"""
         logger.debug('connecting...')
@@ -48,37 +144,423 @@ class IoT(object):
 
         # AWSIoTMQTTClient connection configuration
         mqtt_client.configureAutoReconnectBackoffTime(1, 32, 20)
-        mqtt_client.configureOfflinePublishQueueing(-1)  # Infinite offline Publish queueing
+        if self._spool is None:
+            mqtt_client.configureOfflinePublishQueueing(-1)  # Infinite offline Publish queueing
+        else:
+            mqtt_client.configureOfflinePublishQueueing(0)  # Offline publishes are spooled
         mqtt_client.configureDrainingFrequency(2)  # Draining: 2 Hz
         mqtt_client.configureConnectDisconnectTimeout(10)  # 10 sec
         mqtt_client.configureMQTTOperationTimeout(30)  # 30 sec
+        mqtt_client.onOnline = self._on_online
+        mqtt_client.onOffline = self._on_offline
 
         mqtt_client.connect()
         self.mqtt_client = mqtt_client
+        self._on_online()
 
     def reconnect(self):
         self.mqtt_client.connect()
 
+    def disconnect(self):
+        """Sends what is queued, stops the background threads and disconnects"""
+        self.stop_coalescing()
+        self.stop_publisher()
+        self.stop_dispatcher()
+        self.stop_spooling()
+        if self.mqtt_client:
+            try:
+                self.mqtt_client.disconnect()
+            except Exception: # pylint: disable=broad-except
+                logger.exception('could not disconnect')
+
     def subscribe(self, topic, callback):
         """Wrapper around mqtt subscribe"""
-        def _callback(client, userdata, message):
-            message = json.loads(message.payload)
+        def _handle(client, userdata, message):
+            message = codec.loads(message.payload)
             callback(client, userdata, message)
 
+        def _callback(client, userdata, message):
+            if self.dispatcher:
+                self.dispatcher.dispatch(topic, _handle, (client, userdata, message))
+            else:
+                _handle(client, userdata, message)
+
         logger.debug('subscribing %s', topic)
         self.mqtt_client.subscribe(topic, 1, _callback)
 
-    def publish(self, topic, message):
-        """wrapper around mqtt publish"""
-        if not isinstance(message, str):
-            message['state']['reported']['thing'] = self.client_id
-            message = json.dumps(message)
+    def start_publisher(self, maxsize=100):
+        """
+        Publishes from a background thread.
+
+        Once started, publish only queues the message, and timeouts are retried on
+        the publisher thread.  When a message still can't be published,
+        on_publish_timeout is called with the topic and message.  If the queue is
+        full, the oldest message is dropped.
+        """
+        if self._publisher:
+            return
+        self._stopped.clear()
+        self._outbound = Queue.Queue(maxsize)
+        self._publisher = threading.Thread(target=self._publish_loop, name='publisher')
+        self._publisher.daemon = True
+        self._publisher.start()
+
+    def start_dispatcher(self, workers=2, maxsize=100):
+        """
+        Handles received messages on a pool of worker threads.
+
+        Once started, subscription callbacks no longer run on the MQTT client's
+        thread, so a slow callback doesn't hold up the others.
+        """
+        if self.dispatcher:
+            return
+        self.dispatcher = Dispatcher(workers, maxsize)
+        self.dispatcher.start()
+
+    def stop_dispatcher(self, timeout=5):
+        """Stops the dispatcher's workers once they have handled what is waiting"""
+        dispatcher, self.dispatcher = self.dispatcher, None
+        if dispatcher:
+            dispatcher.stop(timeout)
+
+    def start_spooling(self, directory, max_bytes=10485760, drain_rate=10):
+        """
+        Spools messages to disk while offline.
+
+        Call this before connect.  Once back online, the spool is drained at
+        drain_rate messages per second.  New messages don't wait behind the
+        backlog, which could take hours to drain after a long outage; they are
+        sent straight away, and as the backlog then overwrites the shadow with
+        older state, the newest message to each topic is sent again once it has
+        drained.  A higher drain_rate shortens the window in which the shadow
+        is out of date, at the cost of more traffic while reconnecting.
+        """
+        self._spool = spool.Spool(directory, max_bytes)
+        self.drain_rate = drain_rate
+        self._draining.set()
+        drainer = threading.Thread(target=self._drain_loop, name='drainer')
+        drainer.daemon = True
+        drainer.start()
+
+    def stop_spooling(self):
+        """Stops draining the spool; anything left in it is kept on disk"""
+        self._draining.clear()
+        self._drain.set()
+
+    def stop_publisher(self, timeout=5):
+        """Stops the publisher thread once the queue has been drained"""
+        for shadow in [self] + self._things:
+            if shadow._coalescer: # pylint: disable=protected-access
+                shadow._coalescer.flush() # pylint: disable=protected-access
+        if not self._publisher:
+            return
+        self._stopped.set()
+        self._outbound.put(None)
+        self._publisher.join(timeout)
+        self._publisher = None
+        self._outbound = None
+
+    def _enqueue(self, topic, message, on_timeout, future):
+        if self._outbound is None:
+            try:
+                future.set_result(self._publish(topic, message))
+            except publishTimeoutException as error:
+                future.set_exception(error)
+                raise
+            return
+
+        while True:
+            try:
+                self._outbound.put_nowait((topic, message, on_timeout, future, time.time()))
+                metrics.depth('iot.publish', self._outbound.qsize())
+                return
+            except Queue.Full:
+                try:
+                    dropped = self._outbound.get_nowait()
+                    logger.warning('publish queue full, dropped message to %s', dropped[0])
+                    dropped[3].set_exception(PublishDropped('publish queue full'))
+                except Queue.Empty:
+                    pass
+
+    @metrics.timer('iot.publish')
+    def _publish(self, topic, message):
+        """Publishes message, returning True if it was sent or False if it was spooled"""
+        if self._spool is not None:
+            if not self._online.is_set():
+                self._spool_message(topic, message)
+                return False
+            with self._superseded_lock:
+                if self._spool or self._superseded:
+                    self._superseded[topic] = message
+
         logger.debug('publishing to %s', topic)
+        retries = self.retries
+        interval = self.retry_interval
+        while True:
+            try:
+                self.mqtt_client.publish(topic, message, 1)
+                return True
+            except publishQueueDisabledException:
+                self._spool_message(topic, message)
+                return False
+            except publishTimeoutException:
+                if retries <= 0:
+                    raise
+                retries -= 1
+                self._stopped.wait(interval)
+                interval = min(interval * 2, self.max_retry_interval)
+
+    def _spool_message(self, topic, message):
+        logger.debug('spooling message to %s', topic)
+        self._spool.append(topic, message)
+        self._drain.set()
+
+    def _on_online(self):
+        self._online.set()
+        self._drain.set()
+
+    def _on_offline(self):
+        self._online.clear()
+
+    def _drain_loop(self):
+        while self._draining.is_set():
+            self._drain.wait(1)
+            self._drain.clear()
+            while self._draining.is_set() and self._online.is_set() and self._spool:
+                if not self._drain_spool():
+                    break
+            if self._online.is_set() and not self._spool:
+                self._resend_superseded()
+
+    def _drain_spool(self):
+        """Sends a batch from the spool, returning False if sending failed"""
+        sent = 0
+        last = None
         try:
-            self.mqtt_client.publish(topic, message, 1)
-        except publishTimeoutException:
-            time.sleep(5)
-            self.mqtt_client.publish(topic, message, 1)
+            for position, topic, message in self._spool.peek():
+                try:
+                    self.mqtt_client.publish(topic, message, 1)
+                except (publishTimeoutException, publishQueueDisabledException):
+                    logger.warning('could not drain spool, will retry')
+                    return False
+                sent += 1
+                last = position
+                time.sleep(1.0 / self.drain_rate)
+            return True
+        finally:
+            if sent:
+                self._spool.acknowledge(last, sent)
+
+    def _resend_superseded(self):
+        """Sends the newest live message to each topic again, after the backlog"""
+        with self._superseded_lock:
+            for topic, message in self._superseded.items():
+                try:
+                    self.mqtt_client.publish(topic, message, 1)
+                except (publishTimeoutException, publishQueueDisabledException):
+                    logger.warning('could not resend to %s, will retry', topic)
+                    return
+                del self._superseded[topic]
+
+    def _publish_loop(self):
+        while True:
+            item = self._outbound.get()
+            if item is None:
+                return
+            topic, message, on_timeout, future, enqueued = item
+            metrics.depth('iot.publish', self._outbound.qsize())
+            metrics.REGISTRY.histogram('iot.publish_wait').observe(time.time() - enqueued)
+            try:
+                future.set_result(self._publish(topic, message))
+            except publishTimeoutException as error:
+                future.set_exception(error)
+                on_timeout(topic, message)
+            except Exception as error: # pylint: disable=broad-except
+                future.set_exception(error)
+                logger.exception('could not publish to %s', topic)
+
+def _is_reported_only(message):
+    try:
+        return message.keys() == ['state'] and message['state'].keys() == ['reported']
+    except AttributeError:
+        return False
+
+class Thing(_Shadow):
+    """A thing which shares another thing's IoT connection"""
+    def __init__(self, connection, client_id):
+        self.connection = connection
+        self.client_id = client_id
+        self.on_publish_timeout = None
+        self._coalescer = None
+
+    def subscribe(self, topic, callback):
+        """Subscribes through the shared connection"""
+        self.connection.subscribe(topic, callback)
+
+    def reconnect(self):
+        """Reconnects the shared connection"""
+        self.connection.reconnect()
+
+    def thing(self, client_id):
+        """Another thing on the shared connection"""
+        return self.connection.thing(client_id)
+
+    def _enqueue(self, topic, message, on_timeout, future):
+        self.connection._enqueue(topic, message, on_timeout, future) # pylint: disable=protected-access
+
+class Dispatcher(object):
+    """
+    Runs callbacks on a pool of worker threads, in order for each topic.
+
+    Each topic's messages are handled one at a time, in the order they arrived,
+    while different topics are handled concurrently.  If maxsize messages are
+    waiting for a topic, the oldest is dropped to make room.
+    """
+    def __init__(self, workers=2, maxsize=100):
+        self.workers = workers
+        self.maxsize = maxsize
+        self._pending = {}
+        self._scheduled = set()
+        self._waiting = 0
+        self._ready = Queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Starts the worker threads"""
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name='dispatcher-%d' % index)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        """Stops the worker threads once everything waiting has been handled"""
+        deadline = time.time() + timeout
+        while self._waiting and time.time() < deadline:
+            time.sleep(0.01)
+        for _ in self._threads:
+            self._ready.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def dispatch(self, topic, callback, args):
+        """Queues callback(*args) behind anything already waiting for topic"""
+        with self._lock:
+            pending = self._pending.setdefault(topic, collections.deque())
+            if len(pending) >= self.maxsize:
+                pending.popleft()
+                self._waiting -= 1
+                logger.warning('dispatch queue full, dropped message from %s', topic)
+            pending.append((time.time(), callback, args))
+            self._waiting += 1
+            metrics.depth('iot.dispatch', self._waiting)
+            if topic in self._scheduled:
+                return
+            self._scheduled.add(topic)
+        self._ready.put(topic)
+
+    def _work(self):
+        while True:
+            topic = self._ready.get()
+            if topic is None:
+                return
+            with self._lock:
+                received, callback, args = self._pending[topic].popleft()
+                self._waiting -= 1
+                metrics.depth('iot.dispatch', self._waiting)
+            metrics.REGISTRY.histogram('iot.dispatch_wait').observe(time.time() - received)
+            try:
+                with metrics.timed('iot.dispatch'):
+                    callback(*args)
+            except Exception: # pylint: disable=broad-except
+                logger.exception('callback for %s failed', topic)
+            with self._lock:
+                if not self._pending[topic]:
+                    self._scheduled.discard(topic)
+                    continue
+            self._ready.put(topic)
+
+class ShadowCoalescer(object):
+    """
+    Merges partial reported states into one shadow update.
+
+    The first reported state starts the window; anything reported before it closes
+    is merged in, the latest value for each key winning, and the merged state is
+    handed to flush when the window closes.
+    """
+    def __init__(self, window, flush):
+        self.window = window
+        self._flush = flush
+        self._pending = {}
+        self._future = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def add(self, reported):
+        """Merges reported into the pending update, returning its PublishFuture"""
+        with self._lock:
+            self._pending.update(reported)
+            if not self._future:
+                self._future = PublishFuture()
+            if not self._timer:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            return self._future
+
+    def flush(self):
+        """Hands the pending update and its future to flush now"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            future, self._future = self._future, None
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+        if pending:
+            self._flush(pending, future)
+
+class PublishDropped(IOError):
+    """A queued message was dropped to make room for a newer one"""
+    pass
+
+class PublishPending(Exception):
+    """The publish hasn't happened yet"""
+    pass
+
+class PublishFuture(object):
+    """The outcome of a publish, which is known once the publisher gets to it"""
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def set_result(self, result):
+        """Resolves the future: result is True if sent, False if spooled"""
+        self._result = result
+        self._done.set()
+
+    def set_exception(self, exception):
+        """Fails the future"""
+        self._exception = exception
+        self._done.set()
+
+    def done(self):
+        """True once the future has been resolved or failed"""
+        return self._done.is_set()
+
+    def exception(self, timeout=None):
+        """The exception the publish failed with, or None"""
+        if not self._done.wait(timeout):
+            raise PublishPending()
+        return self._exception
+
+    def result(self, timeout=None):
+        """Waits for the publish, returning True if sent or False if spooled"""
+        if self.exception(timeout):
+            raise self._exception # pylint: disable=raising-bad-type
+        return self._result
 
 class Credentials(object):
     """Credentials container"""
@@ -167,6 +649,11 @@ class DataItem(object):
         """The time this data item was last updated"""
         return self._last_update
 
+    @property
+    def previous_value(self):
+        """The value before this one"""
+        return self._previous_value
+
     def __repr__(self):
         pattern = '%s(value=%r, last_update=%r, previous_value=%r, trend=%r)'
         return pattern % (self.__class__.__name__,
@@ -0,0 +1,140 @@
+"""
+Local messages between things on the same host.
+
+Messages are JSON encoded Unix datagrams, so a sender never blocks on a reader
+which isn't running, and a reader restarting doesn't break the sender.
+
+Heater readings from the socket can stop the heat pump cooling, so the socket
+lives in a directory only its owner can use, and only its owner can write to it.
+Run the things as the same user, and create the directory for them if they
+can't (/run/40stokes needs root); without it, readings only arrive by MQTT.
+"""
+import errno
+import logging
+import os
+import socket
+import threading
+
+import codec
+
+DEFAULT_SOCKET = '/run/40stokes/gas-sensor'
+
+# large enough for any reported state
+_MAX_DATAGRAM = 8192
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+class Sender(object):
+    """Sends messages to a Listener's socket"""
+    def __init__(self, socket_path=DEFAULT_SOCKET):
+        self.socket_path = socket_path
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def send(self, message):
+        """Sends message, returning True if a listener received it"""
+        try:
+            self._socket.sendto(codec.dumps(message), self.socket_path)
+            return True
+        except socket.error as error:
+            # nobody is listening, or the listener is behind
+            if error.errno not in (errno.ENOENT, errno.ECONNREFUSED, errno.EAGAIN):
+                logger.warning('local send failed: %s', error)
+            return False
+
+    def close(self):
+        """Closes the socket"""
+        self._socket.close()
+
+class Listener(object):
+    """
+    Receives messages on a Unix datagram socket.
+
+    callback is called on the listener's thread with each decoded message, using
+    the same signature as an MQTT subscription callback.
+    """
+    def __init__(self, socket_path, callback):
+        self.socket_path = socket_path
+        self.callback = callback
+        self._socket = None
+        self._thread = None
+
+    def start(self):
+        """
+        Binds the socket and starts receiving.
+
+        Returns False, leaving messages to arrive some other way, if the socket
+        can't be set up privately.
+        """
+        if self._thread:
+            return True
+        try:
+            self._socket = self._bind()
+        except (OSError, socket.error) as error:
+            logger.warning('not listening on %s: %s', self.socket_path, error)
+            return False
+        self._thread = threading.Thread(target=self._receive_loop, args=(self._socket,),
+                                        name='ipc')
+        self._thread.daemon = True
+        self._thread.start()
+        return True
+
+    def _bind(self):
+        directory = os.path.dirname(self.socket_path) or '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        status = os.stat(directory)
+        if status.st_uid != os.getuid() or status.st_mode & 0077:
+            raise OSError(errno.EPERM, 'directory is not private to this user', directory)
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+        listening = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # the socket is created with the umask's permissions, so no one else can
+        # reach it between binding and a chmod
+        umask = os.umask(0177)
+        try:
+            listening.bind(self.socket_path)
+        except socket.error:
+            listening.close()
+            raise
+        finally:
+            os.umask(umask)
+        return listening
+
+    def stop(self):
+        """Stops receiving and removes the socket"""
+        if not self._thread:
+            return
+        # wake the receiver, which exits once the socket is gone
+        listening, self._socket = self._socket, None
+        try:
+            sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sender.sendto('', self.socket_path)
+            sender.close()
+        except socket.error:
+            pass
+        self._thread.join(5)
+        self._thread = None
+        listening.close()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+    def _receive_loop(self, listening):
+        while self._socket is listening:
+            data = listening.recv(_MAX_DATAGRAM)
+            if self._socket is not listening:
+                break
+            try:
+                message = codec.loads(data)
+            except ValueError:
+                logger.warning('discarding local message %r', data)
+                continue
+            try:
+                self.callback(None, None, message)
+            except Exception: # pylint: disable=broad-except
+                logger.exception('local message %r', message)
@@ -0,0 +1,139 @@
+"""
+Client for lircd's Unix socket.
+
+Keeps one connection to lircd open rather than forking irsend for every command,
+reconnecting when the connection drops and falling back to irsend when lircd
+can't be reached at all.
+"""
+import logging
+import socket
+import subprocess
+import threading
+
+DEFAULT_SOCKET = '/var/run/lirc/lircd'
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+class LircError(IOError):
+    """lircd replied with an error"""
+    pass
+
+class LircClient(object):
+    """
+    Persistent connection to lircd
+
+    lock serialises use of the IR emitter between everything sharing the client.
+    """
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=5):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.lock = threading.RLock()
+        self._socket = None
+        self._reader = None
+
+    def connect(self):
+        """Connects to lircd"""
+        self.close()
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(self.timeout)
+        try:
+            connection.connect(self.socket_path)
+        except socket.error:
+            connection.close()
+            raise
+        self._socket = connection
+        self._reader = connection.makefile('rb')
+
+    def close(self):
+        """Closes the connection to lircd"""
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+
+    def send_once(self, remote, code):
+        """
+        Sends code from remote once, returning True if it was sent.
+
+        A connection which drops before the command is written is retried once
+        on a fresh connection; if lircd still can't be reached, irsend is used
+        instead.  Once the command has been written it is never sent again: if
+        no reply arrives, the connection is renewed and True is returned, as
+        the code has most likely gone out, and the caller verifies that anyway.
+        """
+        command = 'SEND_ONCE %s %s' % (remote, code)
+        with self.lock:
+            return self._send_once(command, remote, code)
+
+    def _send_once(self, command, remote, code):
+        for _attempt in range(2):
+            try:
+                if not self._socket:
+                    self.connect()
+                self._socket.sendall(command + '\n')
+            except socket.error as error:
+                logger.debug('lircd connection failed: %s', error)
+                self.close()
+                continue
+
+            try:
+                self._await_reply(command)
+                return True
+            except LircError as error:
+                logger.warning('lircd: %s', error)
+                return False
+            except (socket.error, EOFError) as error:
+                logger.warning('no reply from lircd to %s: %s', command, error)
+                self._reconnect()
+                return True
+
+        logger.warning('lircd unavailable, falling back to irsend')
+        return subprocess.call(['irsend', 'SEND_ONCE', remote, code]) == 0
+
+    def _reconnect(self):
+        try:
+            self.connect()
+        except socket.error as error:
+            logger.debug('lircd connection failed: %s', error)
+            self.close()
+
+    def _await_reply(self, command):
+        while True:
+            reply = self._read_reply()
+            if reply and reply[0] == command:
+                break
+            # lircd broadcasts SIGHUP packets to every client; skip them
+            if reply != ['SIGHUP']:
+                # the replies can't be matched up with commands any more
+                self.close()
+                raise LircError('unexpected reply %r' % reply)
+
+        if reply[1:2] == ['ERROR']:
+            raise LircError('; '.join(reply[2:]) or command)
+
+    def _read_reply(self):
+        if self._readline() != 'BEGIN':
+            raise EOFError('expected BEGIN')
+
+        reply = []
+        line = self._readline()
+        while line != 'END':
+            if line == 'DATA':
+                count = self._readline()
+                if not count.isdigit():
+                    self.close()
+                    raise LircError('malformed reply: DATA %r' % count)
+                count = int(count)
+                reply.extend(self._readline() for _ in range(count))
+            else:
+                reply.append(line)
+            line = self._readline()
+        return reply
+
+    def _readline(self):
+        line = self._reader.readline()
+        if not line:
+            raise EOFError('lircd closed the connection')
+        return line.rstrip('\n')
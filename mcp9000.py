@@ -1,24 +1,105 @@
 """
 Module for reading the temperature from the MCP9000 Thermocouple
 """
+import collections
+import time
+
 import smbus
 
-class MCP9000(object): # pylint: disable=too-few-public-methods
-    """Class for reading the temperature from the MCP9000 Thermocouple"""
+HOT_JUNCTION = 0x00
+COLD_JUNCTION = 0x02
+STATUS = 0x04
+SENSOR_CONFIG = 0x05
+DEVICE_CONFIG = 0x06
+
+# status flags
+BURST_COMPLETE = 0x80
+TH_UPDATE = 0x40
+INPUT_RANGE = 0x10
+
+BURST_SAMPLES = [1, 2, 4, 8, 16, 32, 64, 128]
+
+# type K thermocouple, maximum filtering
+_SENSOR = 0x07
+# 0.0625 degree cold junction, 12 bit ADC
+_RESOLUTION = 0x60
+_NORMAL = 0x00
+_BURST = 0x02
 
-    def __init__(self, bus, address):
+Reading = collections.namedtuple('Reading', ['hot', 'cold', 'status'])
+
+class MCP9000(object):
+    """
+    Class for reading the temperature from the MCP9000 Thermocouple
+
+    With burst set, each read triggers a burst of that many conversions, which
+    the device filters into one reading, and waits up to timeout seconds for it.
+    """
+    def __init__(self, bus, address, burst=None, timeout=1):
+        if burst is not None and burst not in BURST_SAMPLES:
+            raise ValueError('burst must be one of %s' % BURST_SAMPLES)
         self.address = address
+        self.burst = burst
+        self.timeout = timeout
         self.bus = smbus.SMBus(bus)
 
-        self.bus.write_byte_data(self.address, 0x05, 0x07)
-        self.bus.write_byte_data(self.address, 0x06, 0x7c)
+        self.bus.write_byte_data(self.address, SENSOR_CONFIG, _SENSOR)
+        self.bus.write_byte_data(self.address, DEVICE_CONFIG, self._device_config(_NORMAL))
 
     @property
     def temperature(self):
-        """Current temperature"""
-        self.bus.write_byte(self.address, 0x00)
+        """Current temperature, or None if it couldn't be read"""
         try:
-            data = self.bus.read_i2c_block_data(self.address, 0x00, 2)
-            return data[0] * 16 + data[1] / 16.0
+            return self._read(cold_junction=False).hot
         except IOError:
             return None
+
+    def read(self):
+        """
+        Reads the hot and cold junction temperatures and the status.
+
+        hot is None if the thermocouple input is out of range, for example when
+        it is disconnected.
+        """
+        return self._read(cold_junction=True)
+
+    def _read(self, cold_junction):
+        if self.burst:
+            status = self._wait_for_burst()
+        else:
+            status = None
+
+        hot = decode(self.bus.read_i2c_block_data(self.address, HOT_JUNCTION, 2))
+        cold = None
+        if cold_junction:
+            cold = decode(self.bus.read_i2c_block_data(self.address, COLD_JUNCTION, 2))
+        if status is None:
+            status = self.bus.read_byte_data(self.address, STATUS)
+
+        if status & INPUT_RANGE:
+            hot = None
+        return Reading(hot, cold, status)
+
+    def _wait_for_burst(self):
+        self.bus.write_byte_data(self.address, STATUS, 0)
+        self.bus.write_byte_data(self.address, DEVICE_CONFIG, self._device_config(_BURST))
+
+        deadline = time.time() + self.timeout
+        while True:
+            status = self.bus.read_byte_data(self.address, STATUS)
+            if status & BURST_COMPLETE:
+                return status
+            if time.time() > deadline:
+                raise IOError('burst timed out')
+            time.sleep(0.01)
+
+    def _device_config(self, mode):
+        samples = BURST_SAMPLES.index(self.burst or BURST_SAMPLES[-1])
+        return _RESOLUTION | samples << 2 | mode
+
+def decode(data):
+    """Decodes a two's complement temperature register, in 1/16 degrees"""
+    value = data[0] << 8 | data[1]
+    if value & 0x8000:
+        value -= 0x10000
+    return value / 16.0
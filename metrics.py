@@ -0,0 +1,222 @@
+"""
+Latency histograms for each stage of the control loop.
+
+Stages are timed with
+
+    with metrics.timed('heatpump.ir_send'):
+        ...
+
+or by decorating a function with @metrics.timer('heatpump.get_action'), which
+costs a couple of clock reads and a bisect, so it is left on.  The
+histograms can be rendered in Prometheus' text format, written to a file for
+node_exporter's textfile collector, or summarised for the shadow.  Queue depths
+are recorded alongside with metrics.depth('iot.dispatch', waiting).
+
+Setting ENABLED to False stops timed functions and blocks being timed, for replaying
+traces, where the latencies mean nothing and the clock reads add up.
+"""
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30)
+
+METRIC = 'heatpump_stage_seconds'
+DEPTH_METRIC = 'heatpump_queue_depth'
+
+ENABLED = True
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+class Histogram(object):
+    """Cumulative histogram of durations, in seconds"""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """Records a duration"""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def quantile(self, quantile):
+        """Estimates a quantile as the upper bound of the bucket it falls in"""
+        with self._lock:
+            target = quantile * self.count
+            cumulative = 0
+            for index, count in enumerate(self.counts):
+                cumulative += count
+                if count and cumulative >= target:
+                    if index < len(self.buckets):
+                        return self.buckets[index]
+                    return self.max
+        return None
+
+class _Timer(object):
+    """Context manager which records how long its block took"""
+    __slots__ = ['_histogram', '_started']
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.time()
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        self._histogram.observe(time.time() - self._started)
+
+class _Untimed(object):
+    """Context manager which records nothing"""
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        pass
+
+_UNTIMED = _Untimed()
+
+class Registry(object):
+    """A set of stage histograms"""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.depths = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage):
+        """The histogram for stage, created if need be"""
+        try:
+            return self.histograms[stage]
+        except KeyError:
+            with self._lock:
+                return self.histograms.setdefault(stage, Histogram(self.buckets))
+
+    def timed(self, stage):
+        """Context manager timing a block as stage"""
+        return _Timer(self.histogram(stage))
+
+    def depth(self, queue, waiting):
+        """Records how many items are waiting in queue"""
+        self.depths[queue] = waiting
+
+    def render(self):
+        """The histograms in Prometheus' text exposition format"""
+        lines = ['# HELP %s Time spent in each stage of the control loop' % METRIC,
+                 '# TYPE %s histogram' % METRIC]
+        for stage in sorted(self.histograms):
+            histogram = self.histograms[stage]
+            with histogram._lock: # pylint: disable=protected-access
+                counts = list(histogram.counts)
+                total, count = histogram.sum, histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append('%s_bucket{stage="%s",le="%s"} %d' %
+                             (METRIC, stage, bound, cumulative))
+            lines.append('%s_sum{stage="%s"} %r' % (METRIC, stage, total))
+            lines.append('%s_count{stage="%s"} %d' % (METRIC, stage, count))
+        if self.depths:
+            lines.extend(['# HELP %s Items waiting in each queue' % DEPTH_METRIC,
+                          '# TYPE %s gauge' % DEPTH_METRIC])
+            for queue, waiting in sorted(self.depths.items()):
+                lines.append('%s{queue="%s"} %d' % (DEPTH_METRIC, queue, waiting))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Writes the rendered histograms to path, replacing it atomically"""
+        with open(path + '.tmp', 'w') as metrics_file:
+            metrics_file.write(self.render())
+        os.rename(path + '.tmp', path)
+
+    def summary(self):
+        """A compact summary of each stage, suitable for the shadow"""
+        summary = {}
+        for stage in sorted(self.histograms):
+            histogram = self.histograms[stage]
+            if not histogram.count:
+                continue
+            summary[stage] = {'count': histogram.count,
+                              'mean': round(histogram.sum / histogram.count, 4),
+                              'p90': histogram.quantile(0.9),
+                              'max': round(histogram.max, 4)}
+        return summary
+
+class Writer(object):
+    """Periodically writes the registry to a file and/or hands on a summary"""
+    def __init__(self, registry, interval=60, path=None, on_summary=None):
+        self.registry = registry
+        self.interval = interval
+        self.path = path
+        self.on_summary = on_summary
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the writer thread"""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the writer thread"""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(5)
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                if self.path:
+                    self.registry.write(self.path)
+                if self.on_summary:
+                    self.on_summary(self.registry.summary())
+            except Exception: # pylint: disable=broad-except
+                logger.exception('could not write metrics')
+
+REGISTRY = Registry()
+
+def timed(stage):
+    """Context manager timing a block as stage in the default registry"""
+    if not ENABLED:
+        return _UNTIMED
+    return REGISTRY.timed(stage)
+
+def depth(queue, waiting):
+    """Records how many items are waiting in queue in the default registry"""
+    REGISTRY.depth(queue, waiting)
+
+def timer(stage):
+    """Decorator timing each call of a function as stage in the default registry"""
+    def _decorate(function):
+        histogram = REGISTRY.histogram(stage)
+
+        @functools.wraps(function)
+        def _timed(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            started = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.time() - started)
+        return _timed
+    return _decorate
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+"""
+replay.py
+
+Replays recorded temperature, humidity and gas heater traces through
+Heatpump.get_action and HeatpumpController.process_state on a virtual clock,
+with IR and MQTT stubbed out, to try setpoint and noise filter changes against
+real history before rolling them out.
+
+    python replay.py trace.csv [--config config.yaml] [--readings-per-sample 3]
+
+A trace is either a CSV file with timestamp, temperature, humidity and
+(optionally) gas_temperature columns, or a history file recorded by the
+controller.  Setpoints, reporting policy, the DHT filter and the gas threshold
+are taken from the heatpump_controller section of the config, if one is given.
+
+The rows of a CSV trace are raw sensor readings, which go through the DHT
+filter as on the device.  The device takes a sample from every three readings,
+so for a log of raw readings pass --readings-per-sample 3; the default of one
+treats each row as one sample's worth.  History files hold samples which were
+filtered on the device, so they are replayed unfiltered.
+
+Every sample goes through the whole controller, reporting policy included, at
+around 25 microseconds a sample on a desktop.  A day of 2 second samples takes
+about a second and a month about half a minute, rather than the few seconds
+hoped for.  To compare many setpoints quickly, narrow them down with sweep.py,
+which runs only the hysteresis as array operations, then replay the best few.
+"""
+import argparse
+import csv
+import logging
+import math
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import fake_gpio
+
+# gpio imports the real drivers, so put the fakes in their place
+fake_gpio.install()
+
+# pylint: disable=wrong-import-position
+import filters
+import gas_sensor
+import gpio
+import heatpump_controller
+import iot
+import metrics
+
+class VirtualClock(object):
+    """Stands in for the time module, only moving when told to"""
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def time(self):
+        """The virtual time"""
+        return self.now
+
+    def sleep(self, seconds):
+        """Advances the virtual time rather than sleeping"""
+        self.now += seconds
+
+@contextmanager
+def virtual_time(clock, modules=(heatpump_controller, iot, gas_sensor)):
+    """Makes modules use clock in place of the time module"""
+    originals = [module.time for module in modules]
+    for module in modules:
+        module.time = clock
+    try:
+        yield clock
+    finally:
+        for module, original in zip(modules, originals):
+            module.time = original
+
+@contextmanager
+def unmeasured():
+    """
+    Switches off stage timing and debug logging, which cost more than the
+    control logic itself and mean nothing when replaying.
+    """
+    enabled, metrics.ENABLED = metrics.ENABLED, False
+    disabled = logging.root.manager.disable
+    logging.disable(max(disabled, logging.DEBUG))
+    try:
+        yield
+    finally:
+        logging.disable(disabled)
+        metrics.ENABLED = enabled
+
+class _IoT(iot.IoT):
+    """IoT which counts publishes rather than sending them"""
+    def __init__(self):
+        super(_IoT, self).__init__('replay')
+        self.published = 0
+
+    def publish(self, topic, message):
+        self.published += 1
+
+class Replay(object):
+    """Feeds a trace through a controller with IR and MQTT stubbed out"""
+    def __init__(self, config=None):
+        config = dict(config or {})
+        config.setdefault('default_setpoints', heatpump_controller.DEFAULT_SETPOINTS)
+        config['dht'] = dict(config.get('dht', {}), data_pin=None, onoff_pin=None)
+        config['led_verify'] = {'le_pin': None, 'd0_pin': None, 'q0_pin': None}
+        gas_config = config.get('gas_sensor', {})
+        config['gas_sensor'] = {'client_id': gas_config.get('client_id', 'replay'),
+                                'threshold': gas_config.get('threshold', 40)}
+        # nothing of the running device's may leak into, or be written by, a replay
+        for key in ['history', 'metrics', 'checkpoint', 'zones']:
+            config.pop(key, None)
+
+        self.controller = heatpump_controller.HeatpumpController(config)
+        self.controller.iot = _IoT()
+        self.controller.heatpump.send_command = self._send_command
+        self.filter_config = config['dht'].get('filter')
+        self.commands = []
+        self.started = None
+        self.now = None
+
+    def _send_command(self, command):
+        self.controller.heatpump._current_action = command # pylint: disable=protected-access
+        self.commands.append((self.now, command['action']))
+        return command
+
+    def run(self, trace, filtered=False, readings_per_sample=1):
+        """
+        Replays trace, an iterable of (timestamp, temperature, humidity,
+        gas_temperature) tuples, returning the number of samples replayed.
+
+        Unless filtered is True, temperatures and humidities are raw readings
+        which go through the DHT filter, and a sample is taken at every
+        readings_per_sample'th reading.
+        """
+        temperature_filter = filters.create(self.filter_config)
+        humidity_filter = filters.create(self.filter_config)
+        clock = VirtualClock()
+        readings = 0
+        count = 0
+        with virtual_time(clock), unmeasured():
+            for timestamp, temperature, humidity, gas_temperature in trace:
+                clock.now = self.now = timestamp
+                if self.started is None:
+                    self.started = timestamp
+                if gas_temperature is not None:
+                    self.controller.update_gas_heater_state(
+                        None, None, {'state': {'reported': {'temperature': gas_temperature}}})
+
+                if temperature is None or humidity is None:
+                    continue
+                if not filtered:
+                    temperature = temperature_filter.update(temperature)
+                    humidity = humidity_filter.update(humidity)
+                    readings += 1
+                    if readings % readings_per_sample:
+                        continue
+                sample = gpio.Sample(round(humidity, 1), round(temperature, 1), timestamp)
+                self.controller.process_state(sample)
+                self.controller.send_sample(sample)
+                count += 1
+        return count
+
+def _value(text):
+    if text is None or text.strip() == '':
+        return None
+    value = float(text)
+    return None if math.isnan(value) else value
+
+def read_csv(path):
+    """Reads a trace from a CSV file with a header row"""
+    with open(path, 'rb') as trace_file:
+        for row in csv.DictReader(trace_file):
+            yield (float(row['timestamp']),
+                   _value(row.get('temperature')),
+                   _value(row.get('humidity')),
+                   _value(row.get('gas_temperature')))
+
+def read_history(path):
+    """Reads a trace of filtered samples from a history file"""
+    import history
+    records = history.History(path).since(0)
+    for record in records:
+        yield (float(record['timestamp']),
+               _value(record['temperature']),
+               _value(record['humidity']),
+               _value(record['gas_temperature']))
+
+def main():
+    """Replays a trace from the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('trace', help='CSV or history file')
+    parser.add_argument('--config', help='config.yaml to take settings from')
+    parser.add_argument('--readings-per-sample', type=int, default=1,
+                        help='raw CSV readings making up each sample')
+    args = parser.parse_args()
+
+    config = None
+    if args.config:
+        import yaml
+        with open(args.config, 'r') as stream:
+            config = yaml.safe_load(stream)['heatpump_controller']
+
+    filtered = not args.trace.endswith('.csv')
+    if filtered:
+        trace = read_history(args.trace)
+    else:
+        trace = read_csv(args.trace)
+
+    replay = Replay(config)
+    started = time.time()
+    count = replay.run(trace, filtered, args.readings_per_sample)
+    elapsed = time.time() - started
+
+    simulated = (replay.now or 0) - (replay.started or 0)
+    actions = sorted(Counter(action for _time, action in replay.commands).items())
+    print 'samples:   %d covering %.1f hours, replayed in %.1fs (%.0fx real time)' % (
+        count, simulated / 3600.0, elapsed, simulated / max(elapsed, 1e-6))
+    print 'commands:  %d (%s)' % (len(replay.commands),
+                                  ', '.join('%s: %d' % item for item in actions))
+    print 'publishes: %d' % replay.controller.iot.published
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Reporting policy: decides which sampled values are worth reporting.
+
+Each field has a deadband (the smallest change worth reporting), a minimum
+interval between reports, a maximum interval after which the value is reported
+regardless, and an optional quantum to which values are rounded.
+"""
+
+DEFAULT_FIELDS = ['temperature', 'humidity']
+
+class FieldPolicy(object): # pylint: disable=too-few-public-methods
+    """Reporting policy for one field"""
+    def __init__(self, deadband=0.2, min_interval=0, max_interval=60, quantum=None):
+        self.deadband = deadband
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.quantum = quantum
+
+    def quantise(self, value):
+        """Rounds value to the nearest quantum"""
+        if not self.quantum:
+            return value
+        return round(round(value / float(self.quantum)) * self.quantum, 6)
+
+    def should_report(self, last, value, now):
+        """
+        Determines whether value should be reported, given the last reported
+        DataItem (or None if nothing has been reported).
+        """
+        if last is None:
+            return True
+
+        age = now - last.last_update
+        if age < self.min_interval:
+            return False
+        if age > self.max_interval:
+            return True
+        return abs(last.value - value) >= self.deadband
+
+class ReportingPolicy(object): # pylint: disable=too-few-public-methods
+    """Reporting policy for a set of fields"""
+    def __init__(self, config=None):
+        config = config or {}
+        self.fields = {}
+        for field in set(DEFAULT_FIELDS) | set(config):
+            self.fields[field] = FieldPolicy(**config.get(field, {}))
+        self._default = FieldPolicy()
+
+    def difference(self, reported, new_state, now):
+        """
+        Returns the (quantised) values from new_state that should be reported.
+
+        reported maps field names to the last reported DataItem, or None.
+        new_state is not modified.
+        """
+        difference = {}
+        for field, value in new_state.iteritems():
+            policy = self.fields.get(field, self._default)
+            value = policy.quantise(value)
+            if policy.should_report(reported.get(field), value, now):
+                difference[field] = value
+        return difference
@@ -0,0 +1,172 @@
+"""
+Disk-backed spool for outbound MQTT messages.
+
+Messages are appended to segment files in a directory; the position of the
+oldest unsent message is kept in a separate file which is replaced atomically.
+On start up the last segment is checked and any record torn by a crash is
+discarded.  Once the spool grows past max_bytes, the oldest segment is dropped.
+"""
+import logging
+import os
+import struct
+import threading
+import zlib
+
+import codec
+
+_HEADER = struct.Struct('>II') # length, crc32
+_SUFFIX = '.spool'
+_POSITION = 'position'
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+class Spool(object):
+    """Append-only on-disk message spool"""
+    def __init__(self, directory, max_bytes=10485760, segment_bytes=1048576):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._segments = sorted(int(name[:-len(_SUFFIX)])
+                                for name in os.listdir(directory)
+                                if name.endswith(_SUFFIX))
+        self._position = self._load_position()
+        self._recover()
+        self._count = sum(len(self._scan(segment, offset))
+                          for segment, offset in self._unread_segments())
+
+    def __len__(self):
+        return self._count
+
+    def append(self, topic, payload):
+        """Appends a message to the spool"""
+        body = codec.dumps({'topic': topic, 'payload': payload})
+        record = _HEADER.pack(len(body), zlib.crc32(body) & 0xffffffff) + body
+        with self._lock:
+            if not self._segments or self._size(self._segments[-1]) >= self.segment_bytes:
+                self._segments.append(self._segments[-1] + 1 if self._segments else 0)
+            with open(self._path(self._segments[-1]), 'ab') as segment_file:
+                segment_file.write(record)
+            self._count += 1
+            self._enforce_limit()
+
+    def peek(self, limit=10):
+        """
+        Returns up to limit of the oldest messages as (position, topic, payload).
+
+        The messages stay in the spool until acknowledge is called with the
+        position of the last one sent; acknowledge a batch at once, as each
+        acknowledgement syncs the position file.
+        """
+        messages = []
+        with self._lock:
+            for segment, offset in self._unread_segments():
+                for end, body in self._scan(segment, offset, limit - len(messages)):
+                    message = codec.loads(body)
+                    messages.append(((segment, end), message['topic'], message['payload']))
+                if len(messages) >= limit:
+                    break
+        return messages
+
+    def acknowledge(self, position, count=None):
+        """
+        Removes the messages up to and including position from the spool.
+
+        count is the number of messages being acknowledged, if known, which
+        saves counting them again.
+        """
+        with self._lock:
+            if position <= self._position:
+                # already dropped to keep the spool under max_bytes
+                return
+            if count is None:
+                count = 0
+                for segment, offset in self._unread_segments():
+                    if segment > position[0]:
+                        break
+                    end = position[1] if segment == position[0] else None
+                    count += len([record for record in self._scan(segment, offset)
+                                  if end is None or record[0] <= end])
+            self._count -= min(count, self._count)
+            self._save_position(position)
+            while self._segments and self._segments[0] < position[0]:
+                os.remove(self._path(self._segments.pop(0)))
+
+    def _unread_segments(self):
+        for segment in self._segments:
+            if segment < self._position[0]:
+                continue
+            yield segment, self._position[1] if segment == self._position[0] else 0
+
+    def _scan(self, segment, offset, limit=None):
+        """Returns (end offset, body) for each valid record from offset"""
+        records = []
+        with open(self._path(segment), 'rb') as segment_file:
+            segment_file.seek(offset)
+            while limit is None or len(records) < limit:
+                header = segment_file.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                length, crc = _HEADER.unpack(header)
+                body = segment_file.read(length)
+                if len(body) < length or zlib.crc32(body) & 0xffffffff != crc:
+                    break
+                offset += _HEADER.size + length
+                records.append((offset, body))
+        return records
+
+    def _recover(self):
+        """Truncates a record torn by a crash from the end of the last segment"""
+        if not self._segments:
+            return
+        last = self._segments[-1]
+        records = self._scan(last, 0)
+        end = records[-1][0] if records else 0
+        if end < self._size(last):
+            logger.warning('discarding %d torn bytes from spool', self._size(last) - end)
+            with open(self._path(last), 'r+b') as segment_file:
+                segment_file.truncate(end)
+
+    def _enforce_limit(self):
+        while len(self._segments) > 1 and self._total_size() > self.max_bytes:
+            oldest = self._segments.pop(0)
+            if oldest >= self._position[0]:
+                offset = self._position[1] if oldest == self._position[0] else 0
+                dropped = len(self._scan(oldest, offset))
+                self._count -= dropped
+                logger.warning('spool full, dropped %d messages', dropped)
+                self._save_position((self._segments[0], 0))
+            os.remove(self._path(oldest))
+
+    def _load_position(self):
+        if not self._segments:
+            return (0, 0)
+        try:
+            with open(os.path.join(self.directory, _POSITION), 'r') as position_file:
+                segment, offset = [int(part) for part in position_file.read().split()]
+        except (IOError, ValueError):
+            return (self._segments[0], 0)
+        if segment not in self._segments:
+            return (self._segments[0], 0)
+        return (segment, offset)
+
+    def _save_position(self, position):
+        path = os.path.join(self.directory, _POSITION)
+        with open(path + '.tmp', 'w') as position_file:
+            position_file.write('%d %d' % position)
+            position_file.flush()
+            os.fsync(position_file.fileno())
+        os.rename(path + '.tmp', path)
+        self._position = position
+
+    def _total_size(self):
+        return sum(self._size(segment) for segment in self._segments)
+
+    def _size(self, segment):
+        return os.path.getsize(self._path(segment))
+
+    def _path(self, segment):
+        return os.path.join(self.directory, '%08d%s' % (segment, _SUFFIX))
@@ -0,0 +1,70 @@
+"""
+How long start up took, by phase.
+
+thing_launcher times importing, loading config and connecting, and controllers
+time their self test.  Each phase is also recorded in the metrics registry as
+startup.<phase>, and the launcher logs the breakdown once, when every thing has
+set its started event.
+"""
+import logging
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+_phases = [] # pylint: disable=invalid-name
+
+class _Phase(object):
+    """Context manager which records how long its block took as a phase"""
+    def __init__(self, name):
+        self.name = name
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.time()
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        record(self.name, time.time() - self._started)
+
+def phase(name):
+    """Context manager timing a block as the phase name"""
+    return _Phase(name)
+
+def record(name, seconds):
+    """Adds seconds to the phase name"""
+    metrics.REGISTRY.histogram('startup.%s' % name).observe(seconds)
+    for index, (existing, total) in enumerate(_phases):
+        if existing == name:
+            _phases[index] = (name, total + seconds)
+            return
+    _phases.append((name, seconds))
+
+def phases():
+    """The phases so far, in the order they started, with their durations"""
+    return list(_phases)
+
+def report():
+    """Logs how long each phase took"""
+    logger.info('started in %.2fs: %s', sum(seconds for _, seconds in _phases),
+                ', '.join('%s %.2fs' % phase_seconds for phase_seconds in _phases))
+
+def report_when_started(controllers, timeout=120):
+    """
+    Reports on a background thread once each of controllers has set its
+    started event, or after timeout seconds.
+    """
+    def _wait():
+        deadline = time.time() + timeout
+        for controller in controllers:
+            started = getattr(controller, 'started', None)
+            if started is not None:
+                started.wait(max(deadline - time.time(), 0))
+        report()
+
+    thread = threading.Thread(target=_wait, name='startup')
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+sweep.py
+
+Evaluates many candidate setpoints against historic temperatures at once.
+
+The Heatpump hysteresis (get_action, holding the last action between commands)
+is run over a temperature series for every candidate setpoint tuple as NumPy
+array operations.  For each candidate this reports:
+
+    starts:   how many times heating or cooling was started
+    runtime:  seconds spent heating or cooling
+    outside:  seconds outside the comfort band without the heat pump acting on it
+              (too cold and not heating, or too hot and not cooling)
+
+The temperatures are replayed as recorded, not simulated, so this compares how
+each candidate would have reacted to what actually happened.
+
+    python sweep.py trace.csv --heating-start 14:18:0.5 --heating-stop 16:20:0.5 \\
+        --cooling-stop 21:24:0.5 --cooling-start 22:27:0.5 --comfort 17:24
+"""
+import argparse
+import sys
+
+import numpy
+
+import heatpump as hp
+
+NONE = 0
+COOLING = 1
+HEATING = 2
+SHUTDOWN = 3
+
+FIELDS = [hp.H1, hp.H0, hp.C0, hp.C1]
+
+RESULT = numpy.dtype([(hp.H1, 'f4'), (hp.H0, 'f4'), (hp.C0, 'f4'), (hp.C1, 'f4'),
+                      ('starts', 'i4'), ('runtime', 'f8'), ('outside', 'f8')])
+
+def grid(heating_start, heating_stop, cooling_stop, cooling_start):
+    """
+    Every valid combination of the given setpoint values, as an (N, 4) array.
+
+    Combinations the Heatpump would reject (not heating_start < heating_stop <
+    cooling_stop < cooling_start) are left out.
+    """
+    mesh = numpy.meshgrid(heating_start, heating_stop, cooling_stop, cooling_start,
+                          indexing='ij')
+    candidates = numpy.stack([axis.ravel() for axis in mesh], axis=1).astype('f4')
+    valid = ((candidates[:, 0] < candidates[:, 1]) &
+             (candidates[:, 1] < candidates[:, 2]) &
+             (candidates[:, 2] < candidates[:, 3]))
+    return candidates[valid]
+
+def actions(temperatures, setpoints, heater_on=None):
+    """
+    The action in force at each sample for each candidate, as a (T, N) array.
+
+    This mirrors Heatpump.get_action with all four setpoints set: above
+    cooling_start cool (unless the gas heater is on), below heating_start heat,
+    between heating_stop and cooling_stop shut down, otherwise carry on.
+    """
+    temperature = numpy.asarray(temperatures, 'f4')[:, None]
+    heating_start, heating_stop, cooling_stop, cooling_start = [
+        setpoints[:, index][None, :] for index in range(4)]
+
+    hot = temperature > cooling_start
+    if heater_on is not None:
+        hot &= ~numpy.asarray(heater_on, bool)[:, None]
+    codes = numpy.where(hot, COOLING,
+                        numpy.where(temperature < heating_start, HEATING,
+                                    numpy.where((temperature > heating_stop) &
+                                                (temperature < cooling_stop),
+                                                SHUTDOWN, NONE))).astype('i1')
+
+    # carry the last command forward to the samples with nothing to do
+    rows = numpy.arange(len(codes))[:, None]
+    last = numpy.maximum.accumulate(numpy.where(codes != NONE, rows, -1), axis=0)
+    held = numpy.take_along_axis(codes, numpy.maximum(last, 0), axis=0)
+    return numpy.where(last >= 0, held, NONE)
+
+def evaluate(temperatures, setpoints, interval=2.0, comfort=(18, 22), heater_on=None,
+             budget=20000000):
+    """
+    Evaluates each candidate in setpoints, an (N, 4) array, over temperatures
+    sampled every interval seconds.  Returns a RESULT array, one row per
+    candidate.
+
+    Candidates are evaluated in chunks of about budget array elements.
+    """
+    temperatures = numpy.asarray(temperatures, 'f4')
+    setpoints = numpy.asarray(setpoints, 'f4').reshape(-1, 4)
+    results = numpy.zeros(len(setpoints), RESULT)
+    for index, field in enumerate(FIELDS):
+        results[field] = setpoints[:, index]
+
+    too_cold = (temperatures < comfort[0])[:, None]
+    too_hot = (temperatures > comfort[1])[:, None]
+    chunk = max(1, budget // max(len(temperatures), 1))
+    for start in range(0, len(setpoints), chunk):
+        state = actions(temperatures, setpoints[start:start + chunk], heater_on)
+        running = (state == HEATING) | (state == COOLING)
+        started = running.copy()
+        started[1:] &= state[1:] != state[:-1]
+        outside = (too_cold & (state != HEATING)) | (too_hot & (state != COOLING))
+
+        results['starts'][start:start + chunk] = started.sum(axis=0)
+        results['runtime'][start:start + chunk] = running.sum(axis=0) * interval
+        results['outside'][start:start + chunk] = outside.sum(axis=0) * interval
+    return results
+
+def rank(results, runtime_weight=0.0, start_weight=0.0):
+    """Orders results best first: least time outside, then fewest starts, then runtime"""
+    score = (results['outside'] + runtime_weight * results['runtime'] +
+             start_weight * results['starts'])
+    order = numpy.lexsort((results['runtime'], results['starts'], score))
+    return results[order]
+
+def _range(text):
+    start, stop, step = [float(part) for part in text.split(':')]
+    return numpy.arange(start, stop + step / 2, step)
+
+def main():
+    """Sweeps setpoints from the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('trace', help='CSV or history file, as for replay.py')
+    for field in FIELDS:
+        parser.add_argument('--' + field.replace('_', '-'), type=_range, required=True,
+                            metavar='FROM:TO:STEP')
+    parser.add_argument('--comfort', default='18:22', help='comfort band, LOW:HIGH')
+    parser.add_argument('--interval', type=float, default=2.0,
+                        help='seconds between samples, default 2')
+    parser.add_argument('--threshold', type=float,
+                        help='gas heater threshold; without it the heater is ignored')
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    import replay
+    if args.trace.endswith('.csv'):
+        trace = list(replay.read_csv(args.trace))
+    else:
+        trace = list(replay.read_history(args.trace))
+    trace = [row for row in trace if row[1] is not None]
+    temperatures = numpy.array([row[1] for row in trace], 'f4')
+
+    heater_on = None
+    if args.threshold is not None:
+        gas = numpy.array([numpy.nan if row[3] is None else row[3] for row in trace])
+        with numpy.errstate(invalid='ignore'):
+            heater_on = gas > args.threshold
+        # hold the last gas reading between readings
+        rows = numpy.arange(len(gas))
+        last = numpy.maximum.accumulate(numpy.where(numpy.isnan(gas), -1, rows))
+        heater_on = numpy.where(last >= 0, heater_on[numpy.maximum(last, 0)], False)
+
+    candidates = grid(*[getattr(args, field) for field in FIELDS])
+    comfort = [float(part) for part in args.comfort.split(':')]
+    results = rank(evaluate(temperatures, candidates, args.interval, comfort, heater_on))
+
+    print '%d candidates over %d samples' % (len(candidates), len(temperatures))
+    print '%6s %6s %6s %6s %7s %10s %10s' % ('H1', 'H0', 'C0', 'C1',
+                                             'starts', 'runtime h', 'outside h')
+    for result in results[:args.top]:
+        print '%6.1f %6.1f %6.1f %6.1f %7d %10.1f %10.1f' % (
+            result[hp.H1], result[hp.H0], result[hp.C0], result[hp.C1],
+            result['starts'], result['runtime'] / 3600, result['outside'] / 3600)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""Tests for the checkpoint module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import shutil
+import tempfile
+import time
+import unittest
+
+import checkpoint
+
+class CheckpointTest(unittest.TestCase):
+    """Tests for saving and loading checkpoints"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        """Verifies a saved checkpoint is loaded"""
+        checkpoint.save(self.path, {'action': 'heating'})
+        self.assertEquals(checkpoint.load(self.path)['action'], 'heating')
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_missing(self):
+        """Verifies there is no checkpoint before one is saved"""
+        self.assertIsNone(checkpoint.load(self.path))
+
+    def test_torn(self):
+        """Verifies a corrupt checkpoint is ignored"""
+        with open(self.path, 'w') as checkpoint_file:
+            checkpoint_file.write('{"action": "hea')
+        self.assertIsNone(checkpoint.load(self.path))
+
+    def test_stale(self):
+        """Verifies a checkpoint older than max_age is ignored"""
+        checkpoint.save(self.path, {})
+        self.assertIsNotNone(checkpoint.load(self.path, max_age=60))
+        time.sleep(0.01)
+        self.assertIsNone(checkpoint.load(self.path, max_age=0))
+
+    def test_checkpointer_saves_on_stop(self):
+        """Verifies stopping the checkpointer saves the latest state"""
+        state = {'action': 'heating'}
+        checkpointer = checkpoint.Checkpointer(self.path, lambda: state, interval=60)
+        checkpointer.start()
+        state = {'action': 'cooling'}
+        checkpointer.stop()
+        self.assertEquals(checkpoint.load(self.path)['action'], 'cooling')
@@ -0,0 +1,46 @@
+"""Tests for the codec module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import json
+import unittest
+
+import codec
+
+class CodecTest(unittest.TestCase):
+    """Tests for encoding and decoding"""
+    def test_round_trip(self):
+        """Verifies whatever JSON library is in use round trips a message"""
+        message = {'state': {'reported': {'temperature': 20.5, 'function': 'heating'}}}
+        self.assertEquals(codec.loads(codec.dumps(message)), message)
+
+    def test_encode_reported(self):
+        """Verifies a reported state is encoded with its thing"""
+        reported = {'temperature': 20.1, 'humidity': 55, 'function': u'heating',
+                    'setpoints': {'heating_start': 16}, 'trend': None}
+        encoded = codec.encode_reported(reported, 'thing')
+        expected = dict(reported, thing='thing')
+        self.assertEquals(json.loads(encoded), {'state': {'reported': expected}})
+
+    def test_thing_replaced(self):
+        """Verifies a thing in the reported state is replaced"""
+        encoded = codec.encode_reported({'thing': 'other', 'temperature': 20}, 'thing')
+        self.assertEquals(json.loads(encoded),
+                          {'state': {'reported': {'temperature': 20, 'thing': 'thing'}}})
+
+    def test_template_reused(self):
+        """Verifies the template for a set of keys is compiled once"""
+        codec.encode_reported({'temperature': 20}, 'thing')
+        template = codec._templates[(('temperature',), 'thing')] # pylint: disable=protected-access
+        codec.encode_reported({'temperature': 21}, 'thing')
+        self.assertIs(codec._templates[(('temperature',), 'thing')], # pylint: disable=protected-access
+                      template)
+
+    def test_special_values(self):
+        """Verifies values which need escaping are encoded correctly"""
+        reported = {'100%': 'say "hi"', 'float': float('inf')}
+        decoded = json.loads(codec.encode_reported(reported, '%s'))
+        self.assertEquals(decoded['state']['reported']['100%'], 'say "hi"')
+        self.assertEquals(decoded['state']['reported']['thing'], '%s')
@@ -0,0 +1,75 @@
+"""Tests for the config_reload module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import fcntl
+import shutil
+import tempfile
+import unittest
+
+import config_reload
+
+class ChangedKeysTest(unittest.TestCase):
+    """Tests for changed_keys"""
+    def test_changed(self):
+        """Verifies added, removed and changed keys are found"""
+        old = {'same': 1, 'changed': {'a': 1}, 'removed': 1}
+        new = {'same': 1, 'changed': {'a': 2}, 'added': 1}
+        self.assertEquals(config_reload.changed_keys(old, new),
+                          set(['changed', 'removed', 'added']))
+
+class RestartTest(unittest.TestCase):
+    """Tests for preparing to restart"""
+    def test_close_on_exec(self):
+        """Verifies open files are marked to be closed by exec"""
+        read_end, write_end = os.pipe()
+        try:
+            config_reload.close_on_exec()
+            for descriptor in [read_end, write_end]:
+                self.assertTrue(fcntl.fcntl(descriptor, fcntl.F_GETFD) & fcntl.FD_CLOEXEC)
+        finally:
+            os.close(read_end)
+            os.close(write_end)
+
+class ConfigWatcherTest(unittest.TestCase):
+    """Tests for the ConfigWatcher class"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'config.yaml')
+        self._write('level: INFO\n')
+        self.changes = []
+        self.watcher = config_reload.ConfigWatcher(self.path, self.changes.append)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, text):
+        with open(self.path, 'w') as config_file:
+            config_file.write(text)
+
+    def test_unchanged(self):
+        """Verifies nothing happens while the file is unchanged"""
+        self.watcher.check()
+        self.assertEquals(self.changes, [])
+
+    def test_changed(self):
+        """Verifies the new config is handed on when the file changes"""
+        self._write('level: DEBUG\n')
+        self.watcher.check()
+        self.assertEquals(self.changes, [{'level': 'DEBUG'}])
+        self.watcher.check()
+        self.assertEquals(len(self.changes), 1)
+
+    def test_invalid(self):
+        """Verifies a config which can't be loaded is ignored"""
+        self._write('level: [DEBUG\n')
+        self.watcher.check()
+        self.assertEquals(self.changes, [])
+
+    def test_unsafe(self):
+        """Verifies a config can't construct arbitrary Python objects"""
+        self._write('level: !!python/object/apply:os.getcwd []\n')
+        self.watcher.check()
+        self.assertEquals(self.changes, [])
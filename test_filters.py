@@ -0,0 +1,73 @@
+"""Tests for the filters module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import unittest
+import filters
+
+class RollingMedianTest(unittest.TestCase):
+    """Tests for the RollingMedian class"""
+    def setUp(self):
+        self.median = filters.RollingMedian(3)
+
+    def test_empty(self):
+        """Verifies there is no value before any readings"""
+        self.assertIsNone(self.median.value)
+
+    def test_odd(self):
+        """Verifies the middle reading is the median"""
+        for reading in [20, 30, 10]:
+            self.median.update(reading)
+        self.assertEquals(self.median.value, 20)
+
+    def test_even(self):
+        """Verifies the median of an even count is the mean of the middle two"""
+        self.median.update(20)
+        self.assertEquals(self.median.update(21), 20.5)
+
+    def test_window(self):
+        """Verifies readings leave the window once it is full"""
+        for reading in [100, 100, 1, 2, 3]:
+            self.median.update(reading)
+        self.assertEquals(self.median.value, 2)
+
+class ExponentialMovingAverageTest(unittest.TestCase):
+    """Tests for the ExponentialMovingAverage class"""
+    def test_average(self):
+        """Verifies each reading moves the average by alpha of the difference"""
+        average = filters.ExponentialMovingAverage(0.5)
+        self.assertEquals(average.update(10), 10)
+        self.assertEquals(average.update(20), 15)
+
+    def test_bad_alpha(self):
+        """Verifies alpha outside (0, 1] is rejected"""
+        with self.assertRaises(ValueError):
+            filters.ExponentialMovingAverage(0)
+
+class KalmanTest(unittest.TestCase):
+    """Tests for the Kalman class"""
+    def test_converges(self):
+        """Verifies the estimate converges on a constant signal despite noise"""
+        kalman = filters.Kalman()
+        for reading in [20.4, 19.6] * 20:
+            kalman.update(reading)
+        self.assertAlmostEquals(kalman.value, 20, places=0)
+
+class CreateTest(unittest.TestCase):
+    """Tests for the create function"""
+    def test_default(self):
+        """Verifies a median filter is the default"""
+        self.assertIsInstance(filters.create(), filters.RollingMedian)
+
+    def test_config(self):
+        """Verifies the filter type and parameters come from config"""
+        ewma = filters.create({'type': filters.EWMA, 'alpha': 0.1})
+        self.assertIsInstance(ewma, filters.ExponentialMovingAverage)
+        self.assertEquals(ewma.alpha, 0.1)
+
+    def test_unknown(self):
+        """Verifies an unknown filter type is rejected"""
+        with self.assertRaises(ValueError):
+            filters.create({'type': 'magic'})
@@ -0,0 +1,36 @@
+"""Tests for the gas_sensor module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import unittest
+
+import gas_sensor
+
+class AdaptiveIntervalTest(unittest.TestCase):
+    """Tests for the AdaptiveInterval class"""
+    def setUp(self):
+        self.interval = gas_sensor.AdaptiveInterval(min_interval=2, max_interval=30,
+                                                    rate=0.1, margin=5, threshold=40)
+
+    def test_backs_off_when_steady(self):
+        """Verifies the interval doubles up to the maximum while cold and steady"""
+        intervals = [self.interval.update(15, now) for now in [0, 4, 12, 28, 60, 90]]
+        self.assertEquals(intervals, [4, 8, 16, 30, 30, 30])
+
+    def test_changing(self):
+        """Verifies a changing temperature is sampled quickly"""
+        self.interval.update(15, 0)
+        self.interval.update(15, 4)
+        self.assertEquals(self.interval.update(20, 12), 2)
+
+    def test_near_threshold(self):
+        """Verifies a steady temperature near the threshold is sampled quickly"""
+        self.interval.update(37, 0)
+        self.assertEquals(self.interval.update(37, 2), 2)
+
+    def test_no_threshold(self):
+        """Verifies the threshold is optional"""
+        interval = gas_sensor.AdaptiveInterval()
+        self.assertEquals(interval.update(40, 0), 4)
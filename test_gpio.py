@@ -0,0 +1,71 @@
+"""Tests for the gpio module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import time
+import unittest
+
+import gpio
+
+class DHT22Test(unittest.TestCase):
+    """Tests for the DHT22 power modes"""
+    def test_bad_power_mode(self):
+        """Verifies an unknown power mode is rejected"""
+        with self.assertRaises(ValueError):
+            gpio.DHT22(None, None, 'sometimes')
+
+    def test_always_on(self):
+        """Verifies an always on sensor is powered at construction and stays on"""
+        dht22 = gpio.DHT22(None, None, gpio.ALWAYS_ON, warm_up=0)
+        self.assertEquals(dht22.sensor_state, gpio.ON)
+        self.assertEquals(dht22.pre_warm_lead, 0)
+
+    def test_pre_warm(self):
+        """Verifies pre_warm powers the sensor on without waiting"""
+        dht22 = gpio.DHT22(None, None, gpio.PRE_WARM, warm_up=60)
+        self.assertEquals(dht22.sensor_state, gpio.OFF)
+        self.assertEquals(dht22.pre_warm_lead, 60)
+
+        started = time.time()
+        dht22.pre_warm()
+        self.assertEquals(dht22.sensor_state, gpio.ON)
+        self.assertLess(time.time() - started, 1)
+
+    def test_warm_up_is_only_paid_once(self):
+        """Verifies a pre-warmed sensor only waits out what is left of the warm up"""
+        dht22 = gpio.DHT22(None, None, gpio.PRE_WARM, warm_up=0.2)
+        dht22.pre_warm()
+        time.sleep(0.2)
+
+        started = time.time()
+        dht22._wait_for_warm_up() #pylint: disable=protected-access
+        self.assertLess(time.time() - started, 0.1)
+
+class SamplerTest(unittest.TestCase):
+    """Tests for the Sampler class"""
+    def test_ring_buffer(self):
+        """Verifies only the newest samples are kept"""
+        sampler = gpio.Sampler(None, size=2)
+        for temperature in [10, 11, 12]:
+            sampler._samples.append(gpio.Sample(50, temperature)) #pylint: disable=protected-access
+
+        self.assertEquals([sample.temperature for sample in sampler.samples], [11, 12])
+        self.assertEquals(sampler.latest.temperature, 12)
+
+    def test_listener_error(self):
+        """Verifies a failing listener doesn't stop sampling or the other listeners"""
+        class _Sensor(object):
+            sample = gpio.Sample(50, 10)
+        def _broken(_sample):
+            raise ValueError('broken')
+        sampler = gpio.Sampler(_Sensor(), interval=0.01)
+        received = []
+        sampler.add_listener(_broken)
+        sampler.add_listener(received.append)
+
+        sampler.start()
+        time.sleep(0.1)
+        sampler.stop()
+        self.assertGreater(len(received), 1)
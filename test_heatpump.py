@@ -78,3 +78,35 @@ class HeatpumpTest(unittest.TestCase):
 
         with self.assertRaises(ValueError):
             self.heatpump.setpoints = {hp.H0: 10, hp.C0: 5}
+
+    def test_action_at_setpoints(self):
+        """Verifies the setpoints themselves fall on the right side of each test"""
+        setpoints = heatpump_controller.DEFAULT_SETPOINTS
+        self.assertIsNone(self.heatpump.get_action(setpoints[hp.H1]))
+        self.assertIsNone(self.heatpump.get_action(setpoints[hp.H0]))
+        self.assertIsNone(self.heatpump.get_action(setpoints[hp.C0]))
+        self.assertIsNone(self.heatpump.get_action(setpoints[hp.C1]))
+
+    def test_action_matches_tests(self):
+        """Verifies the compiled table agrees with the setpoint tests everywhere"""
+        self.heatpump.setpoints = {hp.H1: 15.5, hp.H0: 18, hp.C0: 18.5, hp.C1: 25}
+        for heater_on in [False, True]:
+            for tenth in range(100, 300):
+                temperature = tenth / 10.0
+                expected = self.heatpump._decide(temperature, heater_on) #pylint: disable=protected-access
+                self.heatpump.heater = _Heater(heater_on)
+                self.assertIs(self.heatpump.get_action(temperature), expected)
+
+    def test_action_heater_on(self):
+        """Verifies it doesn't cool while the gas heater is on"""
+        self.heatpump.heater = _Heater(True)
+        action = self.heatpump.get_action(heatpump_controller.DEFAULT_SETPOINTS[hp.C1] + 0.1)
+        self.assertIsNone(action)
+
+    def test_action_no_setpoints(self):
+        """Verifies there is nothing to do before setpoints are given"""
+        self.assertIsNone(hp.Heatpump().get_action(20))
+
+class _Heater(object): # pylint: disable=too-few-public-methods
+    def __init__(self, heater_is_on):
+        self.heater_is_on = heater_is_on
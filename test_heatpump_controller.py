@@ -5,12 +5,17 @@ sys.path.append(os.path.dirname('vendored/'))
 
 # pylint: disable=wrong-import-position
 import time
+import shutil
+import tempfile
+import threading
 import unittest
 import logging
 
 import heatpump_controller
+import gas_sensor
 import heatpump as hp
 import gpio
+import history
 
 from iot import IoT
 
@@ -182,6 +187,284 @@ class HeatpumpControllerTest(unittest.TestCase):
         with(self.assertRaises(_CommandSent)):
             self.controller.process_state(gpio.Sample(temperature=8))
 
+    def test_workers_process_samples(self):
+        """Verifies the worker threads act on and report samples from the sensor"""
+        class _DHT22(object): # pylint: disable=too-few-public-methods
+            sample = gpio.Sample(10, 10)
+        self.controller.sampler.sensor = _DHT22()
+        self.controller.sampler.interval = 0.01
+        self.controller.heatpump._current_action = None #pylint: disable=protected-access
+
+        commanded = threading.Event()
+        reported = threading.Event()
+        self.controller.heatpump.send_command = lambda _command: commanded.set()
+        self.controller.iot.publish = lambda _topic, _message: reported.set()
+
+        self.controller.start_workers()
+        try:
+            self.assertTrue(commanded.wait(1))
+            self.assertTrue(reported.wait(1))
+        finally:
+            self.controller.stop()
+
+    def test_sample_reported_after_decision(self):
+        """Verifies a sample is only reported once it has been decided on"""
+        class _DHT22(object): # pylint: disable=too-few-public-methods
+            sample = gpio.Sample(10, 12)
+        self.controller.sampler.sensor = _DHT22()
+        self.controller.sampler.interval = 60
+        self.controller.heatpump._current_action = None #pylint: disable=protected-access
+
+        events = []
+        reported = threading.Event()
+        def _publish(_topic, message):
+            if 'temperature' in message['state']['reported']:
+                events.append('report')
+                reported.set()
+        self.controller.heatpump.send_command = lambda _command: events.append('command')
+        self.controller.iot.publish = _publish
+
+        self.controller.start_workers()
+        try:
+            self.assertTrue(reported.wait(1))
+            self.assertEquals(events, ['command', 'report'])
+        finally:
+            self.controller.stop()
+
+    def test_workers_apply_desired_state(self):
+        """Verifies desired state received while running is applied by the workers"""
+        applied = threading.Event()
+        self.controller.iot.publish = lambda _topic, _message: applied.set()
+        class _DHT22(object): # pylint: disable=too-few-public-methods
+            sample = None
+        self.controller.sampler.sensor = _DHT22()
+        self.controller.sampler.interval = 60
+
+        self.controller.start_workers()
+        try:
+            self.controller.update_state_callback(None, None, {'state': {hp.H1: 15}})
+            self.assertTrue(applied.wait(1))
+            self.assertEquals(self.controller.heatpump.setpoints[hp.H1], 15)
+        finally:
+            self.controller.stop()
+
+    def test_workers_ignore_stale_sample(self):
+        """Verifies the workers don't act on a sample older than max_sample_age"""
+        applied = threading.Event()
+        commands = []
+        self.controller.iot.publish = lambda _topic, _message: applied.set()
+        self.controller.heatpump.send_command = commands.append
+        self.controller.heatpump._current_action = None #pylint: disable=protected-access
+        class _DHT22(object): # pylint: disable=too-few-public-methods
+            sample = None
+        self.controller.sampler.sensor = _DHT22()
+        self.controller.sampler.interval = 60
+
+        self.controller.start_workers()
+        try:
+            stale = gpio.Sample(10, 12, time.time() - self.controller.max_sample_age - 1)
+            self.controller._on_sample(stale) #pylint: disable=protected-access
+            self.controller.update_state_callback(None, None, {'state': {hp.H1: 15}})
+            self.assertTrue(applied.wait(1))
+            self.controller.stop()
+            self.assertEquals(commands, [])
+        finally:
+            self.controller.stop()
+
+    def test_environment_is_latest_sample(self):
+        """Verifies the environment is the newest buffered sample"""
+        self.assertIsNone(self.controller.environment)
+
+        sample = gpio.Sample(10, 10)
+        self.controller.sampler._samples.append(gpio.Sample(20, 20)) #pylint: disable=protected-access
+        self.controller.sampler._samples.append(sample) #pylint: disable=protected-access
+        self.assertIs(self.controller.environment, sample)
+
+    def test_environment_stale(self):
+        """Verifies a sample older than max_sample_age is not used"""
+        stale = gpio.Sample(10, 10, time.time() - self.controller.max_sample_age - 1)
+        self.controller.sampler._samples.append(stale) #pylint: disable=protected-access
+        self.assertIsNone(self.controller.environment)
+
+    def test_action_recorded(self):
+        """Verifies a command sent to the heatpump is recorded with the next sample"""
+        directory = tempfile.mkdtemp()
+        try:
+            self.controller.history = history.History(os.path.join(directory, 'history'), 10)
+            self.controller.heatpump._current_action = None #pylint: disable=protected-access
+            def _send_command(command):
+                self.controller.heatpump._current_action = command #pylint: disable=protected-access
+            self.controller.heatpump.send_command = _send_command
+
+            self.controller._on_sample(gpio.Sample(50, 10)) #pylint: disable=protected-access
+            self.controller.process_state(gpio.Sample(50, 10))
+            self.controller._on_sample(gpio.Sample(50, 11)) #pylint: disable=protected-access
+            records, = self.controller.history.views()
+            self.assertEquals(list(records['temperature']), [10, 11])
+            self.assertEquals([history.decode_action(code) for code in records['action']],
+                              [None, 'heating'])
+            self.controller.history.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_gas_heater_local_first(self):
+        """Verifies the gas_sensor shadow is ignored while updates arrive locally"""
+        sensor = gas_sensor.GasSensor({'client_id': 'gas', 'threshold': 40})
+        self.controller.gas_sensor = sensor
+        def _update(temperature):
+            return {'state': {'reported': {'temperature': temperature}}}
+
+        self.controller.cloud_gas_heater_state(None, None, _update(30))
+        self.assertEquals(sensor.temperature.value, 30)
+        self.controller.local_gas_heater_state(None, None, _update(50))
+        self.controller.cloud_gas_heater_state(None, None, _update(30))
+        self.assertEquals(sensor.temperature.value, 50)
+
+        self.controller.gas_local_max_age = 0
+        self.controller.cloud_gas_heater_state(None, None, _update(30))
+        self.assertEquals(sensor.temperature.value, 30)
+
+    def test_reconfigure_in_place(self):
+        """Verifies setpoints and reporting are changed without a restart"""
+        config = dict(self.controller.config)
+        config['default_setpoints'] = {'heating_start': 15, 'heating_stop': 17,
+                                       'cooling_stop': 23, 'cooling_start': 25}
+        config['reporting'] = {'temperature': {'deadband': 1}}
+        self.assertTrue(self.controller.reconfigure(config))
+        self.assertEquals(self.controller.heatpump.setpoints['heating_start'], 15)
+        self.assertEquals(self.controller.reporting.fields['temperature'].deadband, 1)
+
+    def test_reconfigure_gas_threshold(self):
+        """Verifies the gas heater threshold is changed without a restart"""
+        self.controller.config = dict(self.controller.config,
+                                      gas_sensor={'client_id': 'gas', 'threshold': 40})
+        self.controller.gas_sensor = gas_sensor.GasSensor(self.controller.config['gas_sensor'])
+        self.assertTrue(self.controller.reconfigure(
+            dict(self.controller.config, gas_sensor={'client_id': 'gas', 'threshold': 50})))
+        self.assertEquals(self.controller.gas_sensor.threshold, 50)
+        self.assertFalse(self.controller.reconfigure(
+            dict(self.controller.config, gas_sensor={'client_id': 'other', 'threshold': 50})))
+
+    def test_reconfigure_restart(self):
+        """Verifies pin changes need a restart"""
+        config = dict(self.controller.config, dht={'data_pin': 4, 'onoff_pin': None})
+        self.assertFalse(self.controller.reconfigure(config))
+
+    def test_snapshot_restored(self):
+        """Verifies a snapshot restores the state, action and setpoints"""
+        self.controller.heatpump.setpoints = {'heating_start': 15, 'heating_stop': 17,
+                                              'cooling_stop': 23, 'cooling_start': 25}
+        self.controller.state.function = 'heating'
+        snapshot = self.controller.snapshot()
+        snapshot['saved'] = time.time()
+
+        restored = heatpump_controller.HeatpumpController(self.controller.config)
+        restored.restore(snapshot)
+        self.assertEquals(restored.heatpump.setpoints, self.controller.heatpump.setpoints)
+        self.assertIs(restored.heatpump.current_action, hp.START_HEATING)
+        self.assertEquals(restored.state.temperature.value, 10)
+        self.assertEquals(restored.state.humidity.value, 10)
+        self.assertEquals(restored.state.function, 'heating')
+
+    def test_stale_snapshot(self):
+        """Verifies nothing is restored from an old snapshot"""
+        self.controller.heatpump.setpoints = {'heating_start': 15, 'heating_stop': 17,
+                                              'cooling_stop': 23, 'cooling_start': 25}
+        snapshot = self.controller.snapshot()
+        snapshot['saved'] = time.time() - 3600
+        snapshot['temperature']['last_update'] = time.time() - 3600
+
+        restored = heatpump_controller.HeatpumpController(self.controller.config)
+        restored.restore(snapshot, max_age=600)
+        self.assertEquals(restored.heatpump.setpoints, heatpump_controller.DEFAULT_SETPOINTS)
+        self.assertIsNone(restored.heatpump.current_action)
+        self.assertIsNone(restored.state.temperature)
+
+    def test_default_setpoints_changed(self):
+        """Verifies changed default_setpoints win over the snapshot's setpoints"""
+        self.controller.heatpump.setpoints = {'heating_start': 15, 'heating_stop': 17,
+                                              'cooling_stop': 23, 'cooling_start': 25}
+        snapshot = self.controller.snapshot()
+        snapshot['saved'] = time.time()
+
+        defaults = {'heating_start': 14, 'heating_stop': 16,
+                    'cooling_stop': 24, 'cooling_start': 26}
+        restored = heatpump_controller.HeatpumpController(
+            dict(self.controller.config, default_setpoints=defaults))
+        restored.restore(snapshot)
+        self.assertEquals(restored.heatpump.setpoints, defaults)
+        self.assertIs(restored.heatpump.current_action, hp.START_HEATING)
+
+    def test_checkpoint_at_boot(self):
+        """Verifies a checkpoint is restored when the controller is created"""
+        directory = tempfile.mkdtemp()
+        try:
+            config = dict(self.controller.config,
+                          checkpoint={'path': os.path.join(directory, 'checkpoint')})
+            self.controller.checkpointer = heatpump_controller.checkpoint.Checkpointer(
+                config['checkpoint']['path'], self.controller.snapshot)
+            self.controller.checkpointer.checkpoint()
+
+            restored = heatpump_controller.HeatpumpController(config)
+            self.assertIs(restored.heatpump.current_action, hp.START_HEATING)
+            self.assertEquals(restored.state.temperature.value, 10)
+        finally:
+            shutil.rmtree(directory)
+
+class MultiZoneControllerTest(unittest.TestCase):
+    """Tests for the MultiZoneController class"""
+    def setUp(self):
+        self.controller = heatpump_controller.create({
+            'dht':{
+                'data_pin': None,
+                'onoff_pin': None
+            },
+            'led_verify':{
+                'le_pin': None,
+                'd0_pin': None,
+                'q0_pin': None
+            },
+            'default_setpoints': heatpump_controller.DEFAULT_SETPOINTS,
+            'zones': [
+                {'thing': 'lounge'},
+                {'thing': 'bedroom',
+                 'remote': 'bedroom_heat_pump',
+                 'dht': {'data_pin': 23, 'onoff_pin': 19}}
+            ]
+        })
+        self.controller.iot = IoT('lounge')
+
+    def test_zones(self):
+        """Verifies each zone has its own remote and sensor"""
+        lounge, bedroom = self.controller.zones
+        self.assertEquals(lounge.heatpump.remote, 'heat_pump')
+        self.assertEquals(bedroom.heatpump.remote, 'bedroom_heat_pump')
+        self.assertEquals(bedroom.dht22.data_pin, 23)
+
+    def test_shared(self):
+        """Verifies the IR emitter and LED verify are shared"""
+        lounge, bedroom = self.controller.zones
+        self.assertIs(lounge.heatpump.lirc, bedroom.heatpump.lirc)
+        self.assertIs(lounge.heatpump.led_verify, bedroom.heatpump.led_verify)
+        self.assertTrue(lounge.watch_gas_sensor)
+        self.assertFalse(bedroom.watch_gas_sensor)
+
+    def test_shadows(self):
+        """Verifies each zone has its own shadow on the shared connection"""
+        lounge, bedroom = self.controller.zones
+        self.assertIs(lounge.iot, self.controller.iot)
+        self.assertEquals(bedroom.iot.client_id, 'bedroom')
+        self.assertIs(bedroom.iot.connection, self.controller.iot)
+
+    def test_zone_without_thing(self):
+        """Verifies every zone must have its own thing"""
+        config = {'dht': {'data_pin': None, 'onoff_pin': None},
+                  'led_verify': {'le_pin': None, 'd0_pin': None, 'q0_pin': None}}
+        for zones in [[{'thing': 'lounge'}, {'remote': 'bedroom_heat_pump'}],
+                      [{'thing': 'lounge'}, {'thing': 'lounge'}]]:
+            with self.assertRaises(ValueError):
+                heatpump_controller.create(dict(config, zones=zones))
+
 class StateTest(unittest.TestCase):
     """Tests for the State class"""
     def setUp(self):
@@ -0,0 +1,69 @@
+"""Tests for the history module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+import history
+
+class HistoryTest(unittest.TestCase):
+    """Tests for the History class"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'history.dat')
+        self.history = history.History(self.path, capacity=3)
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.directory)
+
+    def test_append(self):
+        """Verifies appended records can be read back"""
+        self.history.append(1, 20.5, 50, None, 'heating')
+
+        records, = self.history.views()
+        self.assertEquals(len(self.history), 1)
+        self.assertEquals(records['temperature'][0], 20.5)
+        self.assertTrue(numpy.isnan(records['gas_temperature'][0]))
+        self.assertEquals(history.decode_action(records['action'][0]), 'heating')
+
+    def test_wraps(self):
+        """Verifies the oldest records are overwritten once the file is full"""
+        for timestamp in range(1, 6):
+            self.history.append(timestamp, 20)
+
+        self.assertEquals(len(self.history), 3)
+        timestamps = numpy.concatenate(self.history.views())['timestamp']
+        self.assertEquals(list(timestamps), [3, 4, 5])
+
+    def test_since(self):
+        """Verifies records can be selected by time"""
+        for timestamp in range(1, 6):
+            self.history.append(timestamp, 20)
+
+        self.assertEquals(list(self.history.since(4)['timestamp']), [4, 5])
+        self.assertEquals(list(self.history.since(1)['timestamp']), [3, 4, 5])
+        self.assertEquals(len(self.history.since(6)), 0)
+
+    def test_reopen(self):
+        """Verifies history survives being closed and reopened"""
+        self.history.append(1, 20)
+        self.history.close()
+
+        self.history = history.History(self.path)
+        self.assertEquals(self.history.capacity, 3)
+        self.assertEquals(list(self.history.since(0)['temperature']), [20])
+
+    def test_not_history(self):
+        """Verifies a file which isn't history is rejected"""
+        path = os.path.join(self.directory, 'other.dat')
+        with open(path, 'wb') as other:
+            other.write('x' * 100)
+        with self.assertRaises(ValueError):
+            history.History(path)
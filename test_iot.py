@@ -4,8 +4,18 @@ import sys
 sys.path.append(os.path.dirname('vendored/'))
 
 # pylint: disable=wrong-import-position
+import json
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishTimeoutException
+from AWSIoTPythonSDK.exception.AWSIoTExceptions import publishQueueDisabledException
+
 import iot
+import metrics
 
 class ComputeTrendTest(unittest.TestCase):
     """Tests for the _compute_trend method"""
@@ -76,3 +86,326 @@ class DataItemTest(unittest.TestCase):
     def test_trend_down(self):
         """Verifies trend is down when trend is down"""
         self.assertEquals(self.data_item.compute_trend(19.9), -1)
+
+class _MQTTClient(object):
+    """Stand-in for AWSIoTMQTTClient which records what is published"""
+    def __init__(self, timeouts=0):
+        self.published = []
+        self.timeouts = timeouts
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.disconnected = False
+
+    def publish(self, topic, message, _qos):
+        """Records the message, timing out the first self.timeouts times"""
+        self.entered.set()
+        self.release.wait()
+        if self.timeouts:
+            self.timeouts -= 1
+            raise publishTimeoutException()
+        self.published.append((topic, json.loads(message)))
+
+    def disconnect(self):
+        """Records the disconnection"""
+        self.disconnected = True
+
+class PublisherTest(unittest.TestCase):
+    """Tests for the IoT publisher thread"""
+    def setUp(self):
+        self.iot = iot.IoT('thing')
+        self.iot.retry_interval = 0
+        self.iot.mqtt_client = _MQTTClient()
+
+    def tearDown(self):
+        self.iot.mqtt_client.release.set()
+        self.iot.stop_publisher()
+
+    def test_synchronous(self):
+        """Verifies publish sends immediately when the publisher isn't started"""
+        self.iot.publish('topic', {'state': {'reported': {}}})
+        self.assertEquals(self.iot.mqtt_client.published,
+                          [('topic', {'state': {'reported': {'thing': 'thing'}}})])
+
+    def test_disconnect(self):
+        """Verifies disconnecting sends what is queued first"""
+        self.iot.start_publisher()
+        self.iot.publish('topic', {'state': {'reported': {}}})
+        self.iot.disconnect()
+        self.assertEquals(len(self.iot.mqtt_client.published), 1)
+        self.assertTrue(self.iot.mqtt_client.disconnected)
+
+    def test_does_not_block(self):
+        """Verifies publish returns while the client is blocked"""
+        self.iot.start_publisher()
+        self.iot.mqtt_client.release.clear()
+        self.iot.publish('topic', {'state': {'reported': {}}})
+        self.iot.publish('topic', {'state': {'reported': {}}})
+        self.assertEquals(self.iot.mqtt_client.published, [])
+
+        self.iot.mqtt_client.release.set()
+        self.iot.stop_publisher()
+        self.assertEquals(len(self.iot.mqtt_client.published), 2)
+
+    def test_full_queue_drops_oldest(self):
+        """Verifies the oldest queued message is dropped when the queue is full"""
+        self.iot.mqtt_client.release.clear()
+        self.iot.start_publisher(maxsize=1)
+        self.iot.publish('topic', {'state': {'reported': {'value': 1}}})
+        self.assertTrue(self.iot.mqtt_client.entered.wait(1))
+        for value in [2, 3]:
+            self.iot.publish('topic', {'state': {'reported': {'value': value}}})
+
+        self.iot.mqtt_client.release.set()
+        self.iot.stop_publisher()
+        values = [message['state']['reported']['value']
+                  for _topic, message in self.iot.mqtt_client.published]
+        self.assertEquals(values, [1, 3])
+
+    def test_timeout_retried(self):
+        """Verifies a timeout is retried on the publisher thread"""
+        self.iot.mqtt_client.timeouts = 1
+        self.iot.start_publisher()
+        self.iot.publish('topic', {'state': {'reported': {}}})
+        self.iot.stop_publisher()
+        self.assertEquals(len(self.iot.mqtt_client.published), 1)
+
+    def test_timeout_callback(self):
+        """Verifies on_publish_timeout is called when retries are exhausted"""
+        timed_out = []
+        self.iot.on_publish_timeout = lambda topic, _message: timed_out.append(topic)
+        self.iot.mqtt_client.timeouts = self.iot.retries + 1
+        self.iot.start_publisher()
+        future = self.iot.publish('topic', {'state': {'reported': {}}})
+        self.iot.stop_publisher()
+        self.assertEquals(timed_out, ['topic'])
+        self.assertIsInstance(future.exception(1), publishTimeoutException)
+
+    def test_backoff(self):
+        """Verifies the interval between retries doubles, up to the maximum"""
+        waits = []
+        self.iot._stopped.wait = waits.append # pylint: disable=protected-access
+        self.iot.retry_interval = 1
+        self.iot.max_retry_interval = 3
+        self.iot.mqtt_client.timeouts = self.iot.retries
+        self.iot.publish('topic', {'state': {'reported': {}}})
+        self.assertEquals(waits, [1, 2, 3])
+
+    def test_future(self):
+        """Verifies publish returns a future resolved by the publisher thread"""
+        self.iot.mqtt_client.release.clear()
+        self.iot.start_publisher()
+        future = self.iot.publish('topic', {'state': {'reported': {}}})
+        self.assertFalse(future.done())
+        self.assertRaises(iot.PublishPending, future.result, 0)
+
+        self.iot.mqtt_client.release.set()
+        self.assertTrue(future.result(1))
+        self.assertEquals(metrics.REGISTRY.depths['iot.publish'], 0)
+        self.assertTrue(metrics.REGISTRY.histogram('iot.publish_wait').count)
+
+    def test_dropped_future(self):
+        """Verifies the future of a dropped message fails"""
+        self.iot.mqtt_client.release.clear()
+        self.iot.start_publisher(maxsize=1)
+        self.iot.publish('topic', {'state': {'reported': {'value': 1}}})
+        self.assertTrue(self.iot.mqtt_client.entered.wait(1))
+        dropped = self.iot.publish('topic', {'state': {'reported': {'value': 2}}})
+        self.iot.publish('topic', {'state': {'reported': {'value': 3}}})
+        self.assertIsInstance(dropped.exception(0), iot.PublishDropped)
+
+class CoalescingTest(unittest.TestCase):
+    """Tests for coalescing shadow updates"""
+    def setUp(self):
+        self.iot = iot.IoT('thing')
+        self.iot.mqtt_client = _MQTTClient()
+        self.iot.start_coalescing(60)
+
+    def tearDown(self):
+        self.iot.stop_coalescing()
+
+    def test_merged(self):
+        """Verifies reported states are merged, the last value for a key winning"""
+        shadow_update = self.iot.topics['shadow_update']
+        self.iot.publish(shadow_update, {'state': {'reported': {'temperature': 20}}})
+        self.iot.publish(shadow_update, {'state': {'reported': {'function': 'heating'}}})
+        self.iot.publish(shadow_update, {'state': {'reported': {'temperature': 21}}})
+        self.assertEquals(self.iot.mqtt_client.published, [])
+
+        self.iot.stop_coalescing()
+        self.assertEquals(self.iot.mqtt_client.published, [
+            (shadow_update, {'state': {'reported': {'temperature': 21,
+                                                    'function': 'heating',
+                                                    'thing': 'thing'}}})])
+
+    def test_other_topics(self):
+        """Verifies messages to other topics are not held back"""
+        self.iot.publish(self.iot.topics['get_state'], '{}')
+        self.assertEquals(len(self.iot.mqtt_client.published), 1)
+
+    def test_window(self):
+        """Verifies the merged update is published when the window closes"""
+        self.iot.stop_coalescing()
+        self.iot.start_coalescing(0.01)
+        self.iot.publish(self.iot.topics['shadow_update'],
+                         {'state': {'reported': {'temperature': 20}}})
+        time.sleep(0.1)
+        self.assertEquals(len(self.iot.mqtt_client.published), 1)
+
+class ThingTest(unittest.TestCase):
+    """Tests for things sharing a connection"""
+    def setUp(self):
+        self.iot = iot.IoT('thing')
+        self.iot.mqtt_client = _MQTTClient()
+        self.other = self.iot.thing('other')
+
+    def test_topics(self):
+        """Verifies the thing has its own shadow topics"""
+        self.assertEquals(self.other.topics['shadow_update'],
+                          '$aws/things/other/shadow/update')
+
+    def test_publish(self):
+        """Verifies the thing publishes its own name through the connection"""
+        self.other.publish(self.other.topics['shadow_update'],
+                           {'state': {'reported': {'temperature': 20}}})
+        self.assertEquals(self.iot.mqtt_client.published, [
+            ('$aws/things/other/shadow/update',
+             {'state': {'reported': {'temperature': 20, 'thing': 'other'}}})])
+
+class DispatcherTest(unittest.TestCase):
+    """Tests for the Dispatcher class"""
+    def setUp(self):
+        self.dispatcher = iot.Dispatcher(workers=2, maxsize=3)
+        self.handled = []
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.dispatcher.stop()
+
+    def _handle(self, topic, value):
+        if topic == 'slow':
+            self.release.wait(5)
+        self.handled.append((topic, value))
+
+    def test_ordered(self):
+        """Verifies each topic's messages are handled in order"""
+        self.dispatcher.start()
+        for value in range(3):
+            self.dispatcher.dispatch('a', self._handle, ('a', value))
+            self.dispatcher.dispatch('b', self._handle, ('b', value))
+        self.dispatcher.stop()
+        self.assertEquals([value for topic, value in self.handled if topic == 'a'], [0, 1, 2])
+        self.assertEquals([value for topic, value in self.handled if topic == 'b'], [0, 1, 2])
+
+    def test_slow_topic(self):
+        """Verifies a slow callback doesn't hold up other topics"""
+        self.dispatcher.start()
+        self.dispatcher.dispatch('slow', self._handle, ('slow', 0))
+        self.dispatcher.dispatch('fast', self._handle, ('fast', 0))
+        deadline = time.time() + 5
+        while not self.handled and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEquals(self.handled, [('fast', 0)])
+
+    def test_full_queue_drops_oldest(self):
+        """Verifies the oldest message is dropped when a topic's queue is full"""
+        for value in range(5):
+            self.dispatcher.dispatch('a', self._handle, ('a', value))
+        self.assertEquals(metrics.REGISTRY.depths['iot.dispatch'], 3)
+        self.dispatcher.start()
+        self.dispatcher.stop()
+        self.assertEquals(self.handled, [('a', 2), ('a', 3), ('a', 4)])
+
+class _Broker(_MQTTClient):
+    """Stand-in broker connection which can be taken down and brought back"""
+    def __init__(self):
+        super(_Broker, self).__init__()
+        self.up = True
+        self.onOnline = None # pylint: disable=invalid-name
+        self.onOffline = None # pylint: disable=invalid-name
+
+    def publish(self, topic, message, qos):
+        if not self.up:
+            raise publishQueueDisabledException()
+        super(_Broker, self).publish(topic, message, qos)
+
+    def take_down(self):
+        """Drops the connection"""
+        self.up = False
+        self.onOffline()
+
+    def bring_back(self):
+        """Restores the connection"""
+        self.up = True
+        self.onOnline()
+
+class SpoolingTest(unittest.TestCase):
+    """Tests for spooling publishes while offline"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.iot = iot.IoT('thing')
+        self.iot.start_spooling(self.directory, drain_rate=1000)
+        self.broker = _Broker()
+        self.broker.onOnline = self.iot._on_online #pylint: disable=protected-access
+        self.broker.onOffline = self.iot._on_offline #pylint: disable=protected-access
+        self.iot.mqtt_client = self.broker
+        self.broker.bring_back()
+
+    def tearDown(self):
+        self.iot.stop_spooling()
+        shutil.rmtree(self.directory)
+
+    def _publish(self, value):
+        self.iot.publish('topic', {'state': {'reported': {'value': value}}})
+
+    def _published(self):
+        return [message['state']['reported']['value']
+                for _topic, message in self.broker.published]
+
+    def _wait_for(self, count):
+        deadline = time.time() + 2
+        while len(self.broker.published) < count and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_online(self):
+        """Verifies messages go straight out while online"""
+        self._publish(1)
+        self.assertEquals(self._published(), [1])
+
+    def test_outage(self):
+        """Verifies messages sent during an outage are delivered in order afterwards"""
+        self._publish(1)
+        self.broker.take_down()
+        self._publish(2)
+        self._publish(3)
+        self.assertEquals(self._published(), [1])
+
+        self.broker.bring_back()
+        self._wait_for(3)
+        self._publish(4)
+        self._wait_for(4)
+        self.assertEquals(self._published(), [1, 2, 3, 4])
+
+    def test_live_during_backlog(self):
+        """Verifies new messages skip the backlog and are sent again once it has drained"""
+        self.iot.drain_rate = 20
+        self.broker.take_down()
+        self._publish(1)
+        self._publish(2)
+        self._publish(3)
+        self.broker.bring_back()
+        self._publish(4)
+        self._wait_for(5)
+        published = self._published()
+        self.assertLess(published.index(4), published.index(3))
+        self.assertEquals(sorted(published), [1, 2, 3, 4, 4])
+        self.assertEquals(published[-1], 4)
+
+    def test_unnoticed_outage(self):
+        """Verifies a message is spooled when the client rejects it as offline"""
+        self.broker.up = False
+        self._publish(1)
+        self.broker.bring_back()
+        self._wait_for(1)
+        self.assertEquals(self._published(), [1])
@@ -0,0 +1,68 @@
+"""Tests for the ipc module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import shutil
+import tempfile
+import threading
+import unittest
+
+import ipc
+
+class IpcTest(unittest.TestCase):
+    """Tests for the Sender and Listener classes"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, 'gas')
+        self.received = []
+        self.arrived = threading.Event()
+        self.listener = ipc.Listener(self.socket_path, self._callback)
+        self.sender = ipc.Sender(self.socket_path)
+
+    def tearDown(self):
+        self.sender.close()
+        self.listener.stop()
+        shutil.rmtree(self.directory)
+
+    def _callback(self, _client, _userdata, message):
+        self.received.append(message)
+        self.arrived.set()
+
+    def test_send(self):
+        """Verifies messages are decoded and handed to the callback"""
+        self.assertTrue(self.listener.start())
+        message = {'state': {'reported': {'temperature': 45}}}
+        self.assertTrue(self.sender.send(message))
+        self.assertTrue(self.arrived.wait(5))
+        self.assertEquals(self.received, [message])
+
+    def test_no_listener(self):
+        """Verifies sending without a listener doesn't raise"""
+        self.assertFalse(self.sender.send({}))
+
+    def test_permissions(self):
+        """Verifies only the owner can send to the socket"""
+        self.listener.start()
+        self.assertEquals(os.stat(self.socket_path).st_mode & 0777, 0600)
+
+    def test_shared_directory(self):
+        """Verifies the socket isn't created in a directory others can use"""
+        os.chmod(self.directory, 0755)
+        self.assertFalse(self.listener.start())
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_unusable_directory(self):
+        """Verifies a directory which can't be created is reported, not raised"""
+        blocker = os.path.join(self.directory, 'file')
+        open(blocker, 'w').close()
+        listener = ipc.Listener(os.path.join(blocker, 'gas'), self._callback)
+        self.assertFalse(listener.start())
+
+    def test_stop(self):
+        """Verifies stopping removes the socket"""
+        self.listener.start()
+        self.listener.stop()
+        self.assertFalse(os.path.exists(self.socket_path))
+        self.assertFalse(self.sender.send({}))
@@ -0,0 +1,80 @@
+"""Tests for the lirc module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import shutil
+import tempfile
+import unittest
+
+import lirc
+from fake_lircd import FakeLircd
+
+class LircClientTest(unittest.TestCase):
+    """Tests for the LircClient class"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, 'lircd')
+        self.lircd = FakeLircd(self.socket_path)
+        self.client = lirc.LircClient(self.socket_path, timeout=1)
+        self.fallback = []
+        self.call = lirc.subprocess.call
+        lirc.subprocess.call = lambda args: self.fallback.append(args) or 0
+
+    def tearDown(self):
+        lirc.subprocess.call = self.call
+        self.client.close()
+        if self.lircd:
+            self.lircd.stop()
+        shutil.rmtree(self.directory)
+
+    def test_send_once(self):
+        """Verifies commands share one connection"""
+        self.assertTrue(self.client.send_once('heat_pump', 'maxcold'))
+        self.assertTrue(self.client.send_once('heat_pump', 'stokesoff'))
+        self.assertEquals(self.lircd.commands, ['SEND_ONCE heat_pump maxcold',
+                                                'SEND_ONCE heat_pump stokesoff'])
+        self.assertEquals(len(self.lircd.connections), 1)
+        self.assertEquals(self.fallback, [])
+
+    def test_error(self):
+        """Verifies an error from lircd is a failed send, not a fallback"""
+        self.assertFalse(self.client.send_once('heat_pump', 'broken'))
+        self.assertEquals(self.fallback, [])
+
+    def test_empty_reply(self):
+        """Verifies an empty reply is a failed send, and the connection is renewed"""
+        self.assertFalse(self.client.send_once('heat_pump', 'empty'))
+        self.assertTrue(self.client.send_once('heat_pump', 'maxcold'))
+        self.assertEquals(self.lircd.commands, ['SEND_ONCE heat_pump empty',
+                                                'SEND_ONCE heat_pump maxcold'])
+        self.assertEquals(len(self.lircd.connections), 2)
+
+    def test_no_reply(self):
+        """Verifies a command which got no reply is not sent again"""
+        self.client.timeout = 0.1
+        self.assertTrue(self.client.send_once('heat_pump', 'silent'))
+        self.assertEquals(self.lircd.commands, ['SEND_ONCE heat_pump silent'])
+        self.assertEquals(self.fallback, [])
+
+        self.assertTrue(self.client.send_once('heat_pump', 'maxcold'))
+        self.assertEquals(self.lircd.commands[-1], 'SEND_ONCE heat_pump maxcold')
+
+    def test_reconnect(self):
+        """Verifies the client reconnects when lircd is restarted"""
+        self.assertTrue(self.client.send_once('heat_pump', 'maxcold'))
+        self.lircd.stop()
+        self.lircd = FakeLircd(self.socket_path)
+
+        self.assertTrue(self.client.send_once('heat_pump', 'stokesheat'))
+        self.assertEquals(self.lircd.commands, ['SEND_ONCE heat_pump stokesheat'])
+        self.assertEquals(self.fallback, [])
+
+    def test_fallback(self):
+        """Verifies irsend is used when lircd can't be reached"""
+        self.lircd.stop()
+        self.lircd = None
+
+        self.assertTrue(self.client.send_once('heat_pump', 'maxcold'))
+        self.assertEquals(self.fallback, [['irsend', 'SEND_ONCE', 'heat_pump', 'maxcold']])
@@ -0,0 +1,74 @@
+"""Tests for the mcp9000 module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import unittest
+
+import fake_smbus
+sys.modules.setdefault('smbus', fake_smbus)
+import mcp9000
+
+class MCP9000Test(unittest.TestCase):
+    """Tests for the MCP9000 class"""
+    def setUp(self):
+        fake_smbus.hot = 45.5
+        fake_smbus.cold = 18.25
+
+    def tearDown(self):
+        fake_smbus.hot = 20.0
+        fake_smbus.cold = 18.0
+
+    def test_configured(self):
+        """Verifies the sensor and device are configured"""
+        sensor = mcp9000.MCP9000(1, 0x63)
+        self.assertEquals(sensor.bus.registers[mcp9000.SENSOR_CONFIG], 0x07)
+        self.assertEquals(sensor.bus.registers[mcp9000.DEVICE_CONFIG], 0x7c)
+
+    def test_read(self):
+        """Verifies a read takes one transaction per register"""
+        sensor = mcp9000.MCP9000(1, 0x63)
+        sensor.bus.transactions = []
+        self.assertEquals(sensor.read(), (45.5, 18.25, 0))
+        self.assertEquals(len(sensor.bus.transactions), 3)
+
+    def test_temperature(self):
+        """Verifies the temperature is read without the cold junction"""
+        sensor = mcp9000.MCP9000(1, 0x63)
+        sensor.bus.transactions = []
+        self.assertEquals(sensor.temperature, 45.5)
+        self.assertEquals(len(sensor.bus.transactions), 2)
+
+    def test_negative(self):
+        """Verifies temperatures below zero are decoded"""
+        fake_smbus.cold = -5.0625
+        self.assertEquals(mcp9000.MCP9000(1, 0x63).read().cold, -5.0625)
+
+    def test_burst(self):
+        """Verifies a burst is triggered and waited for"""
+        sensor = mcp9000.MCP9000(1, 0x63, burst=16)
+        sensor.bus.transactions = []
+        reading = sensor.read()
+        self.assertEquals(reading.hot, 45.5)
+        self.assertTrue(reading.status & mcp9000.BURST_COMPLETE)
+        self.assertIn(('write_byte_data', 0x63, mcp9000.DEVICE_CONFIG, 0x72),
+                      sensor.bus.transactions)
+
+    def test_burst_timeout(self):
+        """Verifies a burst which never completes is reported as no temperature"""
+        sensor = mcp9000.MCP9000(1, 0x63, burst=16, timeout=0)
+        sensor.bus.write_byte_data = lambda address, register, value: None
+        self.assertRaises(IOError, sensor.read)
+        self.assertIsNone(sensor.temperature)
+
+    def test_input_range(self):
+        """Verifies an out of range thermocouple gives no hot junction temperature"""
+        sensor = mcp9000.MCP9000(1, 0x63)
+        sensor.bus.registers[mcp9000.STATUS] = mcp9000.INPUT_RANGE
+        self.assertIsNone(sensor.read().hot)
+        self.assertEquals(sensor.read().cold, 18.25)
+
+    def test_invalid_burst(self):
+        """Verifies burst must be a supported number of samples"""
+        self.assertRaises(ValueError, mcp9000.MCP9000, 1, 0x63, 3)
@@ -0,0 +1,90 @@
+"""Tests for the metrics module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import unittest
+
+import metrics
+
+class HistogramTest(unittest.TestCase):
+    """Tests for the Histogram class"""
+    def setUp(self):
+        self.histogram = metrics.Histogram((0.1, 1))
+
+    def test_observe(self):
+        """Verifies durations land in the right buckets"""
+        for seconds in [0.05, 0.1, 0.5, 5]:
+            self.histogram.observe(seconds)
+        self.assertEquals(self.histogram.counts, [2, 1, 1])
+        self.assertEquals(self.histogram.count, 4)
+        self.assertEquals(self.histogram.max, 5)
+
+    def test_quantile(self):
+        """Verifies quantiles are estimated from the bucket bounds"""
+        self.assertIsNone(self.histogram.quantile(0.5))
+        for seconds in [0.05, 0.05, 0.5, 5]:
+            self.histogram.observe(seconds)
+        self.assertEquals(self.histogram.quantile(0.5), 0.1)
+        self.assertEquals(self.histogram.quantile(0.75), 1)
+        self.assertEquals(self.histogram.quantile(1), 5)
+
+class RegistryTest(unittest.TestCase):
+    """Tests for the Registry class"""
+    def setUp(self):
+        self.registry = metrics.Registry((0.1, 1))
+
+    def test_timed(self):
+        """Verifies a timed block is recorded against its stage"""
+        with self.registry.timed('stage'):
+            pass
+        self.assertEquals(self.registry.histogram('stage').count, 1)
+
+    def test_render(self):
+        """Verifies the Prometheus rendering has cumulative buckets"""
+        self.registry.histogram('stage').observe(0.5)
+        rendered = self.registry.render()
+        self.assertIn('heatpump_stage_seconds_bucket{stage="stage",le="0.1"} 0', rendered)
+        self.assertIn('heatpump_stage_seconds_bucket{stage="stage",le="1"} 1', rendered)
+        self.assertIn('heatpump_stage_seconds_bucket{stage="stage",le="+Inf"} 1', rendered)
+        self.assertIn('heatpump_stage_seconds_count{stage="stage"} 1', rendered)
+
+    def test_render_depth(self):
+        """Verifies queue depths are rendered as gauges"""
+        self.registry.depth('queue', 3)
+        self.assertIn('heatpump_queue_depth{queue="queue"} 3', self.registry.render())
+
+    def test_summary(self):
+        """Verifies the summary leaves out stages which haven't run"""
+        self.registry.histogram('idle')
+        self.registry.histogram('busy').observe(0.5)
+        self.assertEquals(self.registry.summary(),
+                          {'busy': {'count': 1, 'mean': 0.5, 'p90': 1, 'max': 0.5}})
+
+class TimerTest(unittest.TestCase):
+    """Tests for the timer decorator"""
+    def test_timer(self):
+        """Verifies calls are timed, even when they raise"""
+        @metrics.timer('test_metrics.raises')
+        def _raises():
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            _raises()
+        self.assertEquals(metrics.REGISTRY.histogram('test_metrics.raises').count, 1)
+
+    def test_disabled(self):
+        """Verifies calls and blocks aren't timed while timing is switched off"""
+        @metrics.timer('test_metrics.disabled')
+        def _add(left, right):
+            return left + right
+
+        metrics.ENABLED = False
+        try:
+            self.assertEquals(_add(1, 2), 3)
+            with metrics.timed('test_metrics.disabled'):
+                pass
+        finally:
+            metrics.ENABLED = True
+        self.assertEquals(metrics.REGISTRY.histogram('test_metrics.disabled').count, 0)
@@ -0,0 +1,89 @@
+"""Tests for the replay module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import shutil
+import tempfile
+import time
+import unittest
+
+import checkpoint
+import heatpump_controller
+import metrics
+import replay
+
+class ReplayTest(unittest.TestCase):
+    """Tests for the Replay class"""
+    def setUp(self):
+        self.replay = replay.Replay({'dht': {'filter': {'window': 1}}})
+
+    def test_actions(self):
+        """Verifies the controller's commands are collected against trace time"""
+        trace = [(1000, 10, 50, None), (1002, 20, 50, None), (1004, 30, 50, None)]
+        self.assertEquals(self.replay.run(trace), 3)
+        self.assertEquals(self.replay.commands, [(1000, 'heating'),
+                                                 (1002, 'shutdown'),
+                                                 (1004, 'cooling')])
+
+    def test_gas_heater(self):
+        """Verifies the gas heater stops cooling"""
+        trace = [(1000, 30, 50, 80), (1002, 30, 50, None)]
+        self.replay.run(trace)
+        self.assertEquals(self.replay.commands, [])
+
+    def test_filter(self):
+        """Verifies the configured filter is applied to the trace"""
+        self.replay = replay.Replay({'dht': {'filter': {'window': 3}}})
+        self.replay.run([(1000, 10, 50, None), (1002, 20, 50, None)])
+        self.assertEquals(self.replay.commands, [(1000, 'heating')])
+
+    def test_filtered(self):
+        """Verifies an already filtered trace is not filtered again"""
+        self.replay = replay.Replay({'dht': {'filter': {'window': 3}}})
+        self.replay.run([(1000, 10, 50, None), (1002, 20, 50, None)], filtered=True)
+        self.assertEquals(self.replay.commands, [(1000, 'heating'), (1002, 'shutdown')])
+
+    def test_readings_per_sample(self):
+        """Verifies a sample is taken from every readings_per_sample readings"""
+        trace = [(1000, 10, 50, None), (1001, 10, 50, None), (1002, 20, 50, None),
+                 (1003, 20, 50, None)]
+        self.assertEquals(self.replay.run(trace, readings_per_sample=2), 2)
+        self.assertEquals(self.replay.commands, [(1001, 'heating'), (1003, 'shutdown')])
+
+    def test_virtual_time(self):
+        """Verifies the controller sees trace time, and real time is restored"""
+        self.replay.run([(1000, 20, 50, None)])
+        self.assertEquals(self.replay.controller.state.last_update, 1000)
+        self.assertIs(heatpump_controller.time, time)
+        self.assertTrue(metrics.ENABLED)
+
+    def test_checkpoint_ignored(self):
+        """Verifies a configured checkpoint is neither restored nor written"""
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'checkpoint')
+            setpoints = dict(heatpump_controller.DEFAULT_SETPOINTS, heating_start=5)
+            checkpoint.save(path, {'setpoints': setpoints, 'action': 'cooling',
+                                   'default_setpoints': heatpump_controller.DEFAULT_SETPOINTS})
+            saved = os.path.getmtime(path)
+
+            self.replay = replay.Replay({'checkpoint': {'path': path}})
+            self.assertEquals(self.replay.controller.heatpump.setpoints,
+                              heatpump_controller.DEFAULT_SETPOINTS)
+            self.assertIsNone(self.replay.controller.heatpump.current_action)
+            self.assertIsNone(self.replay.controller.checkpointer)
+            self.replay.run([(1000, 10, 50, None)])
+            self.assertEquals(self.replay.commands, [(1000, 'heating')])
+            self.assertEquals(os.path.getmtime(path), saved)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_setpoints_from_config(self):
+        """Verifies setpoints can be taken from config"""
+        setpoints = dict(heatpump_controller.DEFAULT_SETPOINTS, heating_start=5)
+        self.replay = replay.Replay({'default_setpoints': setpoints})
+        self.assertEquals(self.replay.controller.heatpump.setpoints, setpoints)
+        self.replay.run([(1000, 10, 50, None)])
+        self.assertEquals(self.replay.commands, [])
@@ -0,0 +1,52 @@
+"""Tests for the reporting module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import unittest
+
+import reporting
+from iot import DataItem
+
+class FieldPolicyTest(unittest.TestCase):
+    """Tests for the FieldPolicy class"""
+    def setUp(self):
+        self.policy = reporting.FieldPolicy(deadband=0.5, min_interval=10, max_interval=60)
+        self.last = DataItem(20, last_update=1000)
+
+    def test_first(self):
+        """Verifies a value is reported when nothing has been reported"""
+        self.assertTrue(self.policy.should_report(None, 20, 1000))
+
+    def test_deadband(self):
+        """Verifies only changes of at least the deadband are reported"""
+        self.assertFalse(self.policy.should_report(self.last, 20.4, 1030))
+        self.assertTrue(self.policy.should_report(self.last, 20.5, 1030))
+        self.assertTrue(self.policy.should_report(self.last, 19.5, 1030))
+
+    def test_min_interval(self):
+        """Verifies nothing is reported within min_interval of the last report"""
+        self.assertFalse(self.policy.should_report(self.last, 30, 1005))
+
+    def test_max_interval(self):
+        """Verifies an unchanged value is reported once max_interval has passed"""
+        self.assertTrue(self.policy.should_report(self.last, 20, 1061))
+
+    def test_quantise(self):
+        """Verifies values are rounded to the quantum"""
+        policy = reporting.FieldPolicy(quantum=0.5)
+        self.assertEquals(policy.quantise(20.26), 20.5)
+        self.assertEquals(reporting.FieldPolicy().quantise(20.26), 20.26)
+
+class ReportingPolicyTest(unittest.TestCase):
+    """Tests for the ReportingPolicy class"""
+    def test_difference(self):
+        """Verifies each field is judged by its own policy"""
+        policy = reporting.ReportingPolicy({'humidity': {'deadband': 5}})
+        reported = {'temperature': DataItem(20, last_update=1000),
+                    'humidity': DataItem(50, last_update=1000)}
+        new_state = {'temperature': 21, 'humidity': 52}
+
+        self.assertEquals(policy.difference(reported, new_state, 1001), {'temperature': 21})
+        self.assertEquals(new_state, {'temperature': 21, 'humidity': 52})
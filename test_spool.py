@@ -0,0 +1,86 @@
+"""Tests for the spool module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import shutil
+import tempfile
+import unittest
+
+import spool
+
+class SpoolTest(unittest.TestCase):
+    """Tests for the Spool class"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool = spool.Spool(self.directory, segment_bytes=100)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _drain(self):
+        messages = self.spool.peek(100)
+        if messages:
+            self.spool.acknowledge(messages[-1][0])
+        return [payload for _position, _topic, payload in messages]
+
+    def test_order(self):
+        """Verifies messages come out in the order they went in, across segments"""
+        for number in range(10):
+            self.spool.append('topic', str(number))
+        self.assertEquals(len(self.spool), 10)
+        self.assertEquals(self._drain(), [str(number) for number in range(10)])
+        self.assertEquals(len(self.spool), 0)
+
+    def test_peek_does_not_remove(self):
+        """Verifies messages stay spooled until acknowledged"""
+        self.spool.append('topic', 'message')
+        self.assertEquals(len(self.spool.peek()), 1)
+        self.assertEquals(self.spool.peek()[0][1:], ('topic', 'message'))
+        self.assertEquals(len(self.spool), 1)
+
+    def test_recovery(self):
+        """Verifies unsent messages survive a restart, and sent ones don't return"""
+        for number in range(5):
+            self.spool.append('topic', str(number))
+        self.spool.acknowledge(self.spool.peek(2)[-1][0])
+
+        recovered = spool.Spool(self.directory, segment_bytes=100)
+        self.assertEquals(len(recovered), 3)
+        self.spool = recovered
+        self.assertEquals(self._drain(), ['2', '3', '4'])
+
+    def test_acknowledge_batch(self):
+        """Verifies a batch can be acknowledged with its size, and only once"""
+        for number in range(5):
+            self.spool.append('topic', str(number))
+        batch = self.spool.peek(3)
+        self.spool.acknowledge(batch[-1][0], len(batch))
+        self.spool.acknowledge(batch[-1][0], len(batch))
+        self.assertEquals(len(self.spool), 2)
+        self.assertEquals(self._drain(), ['3', '4'])
+
+    def test_torn_record(self):
+        """Verifies a partly written record is discarded on recovery"""
+        self.spool.append('topic', 'whole')
+        segment = sorted(os.listdir(self.directory))[0]
+        with open(os.path.join(self.directory, segment), 'ab') as segment_file:
+            segment_file.write('\x00\x00\x00\x40torn')
+
+        self.spool = spool.Spool(self.directory, segment_bytes=100)
+        self.assertEquals(len(self.spool), 1)
+        self.spool.append('topic', 'after')
+        self.assertEquals(self._drain(), ['whole', 'after'])
+
+    def test_size_limit(self):
+        """Verifies the oldest messages are dropped once the spool is too big"""
+        self.spool = spool.Spool(self.directory, max_bytes=300, segment_bytes=100)
+        for number in range(20):
+            self.spool.append('topic', str(number))
+
+        drained = self._drain()
+        self.assertEquals(len(self.spool), 0)
+        self.assertLess(len(drained), 20)
+        self.assertEquals(drained[-1], '19')
+        self.assertEquals(drained, [str(number) for number in range(20 - len(drained), 20)])
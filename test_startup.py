@@ -0,0 +1,52 @@
+"""Tests for the startup module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import threading
+import unittest
+
+import metrics
+import startup
+
+class StartupTest(unittest.TestCase):
+    """Tests for timing start up phases"""
+    def setUp(self):
+        del startup._phases[:] # pylint: disable=protected-access
+
+    def test_phases_in_order(self):
+        """Verifies phases are kept in the order they started, repeats adding up"""
+        startup.record('import', 0.5)
+        with startup.phase('config'):
+            pass
+        startup.record('import', 0.25)
+        phases = startup.phases()
+        self.assertEquals([name for name, _ in phases], ['import', 'config'])
+        self.assertEquals(phases[0][1], 0.75)
+
+    def test_metrics(self):
+        """Verifies phases are recorded in the metrics registry"""
+        count = metrics.REGISTRY.histogram('startup.connect').count
+        startup.record('connect', 1)
+        self.assertEquals(metrics.REGISTRY.histogram('startup.connect').count, count + 1)
+
+    def test_report_when_started(self):
+        """Verifies the breakdown is reported once, after every thing has started"""
+        class _Controller(object): # pylint: disable=too-few-public-methods
+            def __init__(self):
+                self.started = threading.Event()
+        controllers = [_Controller(), _Controller()]
+        reports = []
+        report = startup.report
+        startup.report = lambda: reports.append(True)
+        try:
+            thread = startup.report_when_started(controllers)
+            controllers[0].started.set()
+            thread.join(0.1)
+            self.assertEquals(reports, [])
+            controllers[1].started.set()
+            thread.join(1)
+            self.assertEquals(reports, [True])
+        finally:
+            startup.report = report
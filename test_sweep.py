@@ -0,0 +1,67 @@
+"""Tests for the sweep module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import random
+import unittest
+
+import numpy
+
+import heatpump as hp
+import sweep
+
+_CODES = {'cooling': sweep.COOLING, 'heating': sweep.HEATING, 'shutdown': sweep.SHUTDOWN}
+
+class _Heater(object): # pylint: disable=too-few-public-methods
+    heater_is_on = False
+
+class SweepTest(unittest.TestCase):
+    """Tests for the sweep module"""
+    def setUp(self):
+        random.seed(1)
+        self.temperatures = [random.uniform(10, 30) for _ in range(200)]
+        self.heater_on = [random.random() < 0.2 for _ in range(200)]
+        self.setpoints = sweep.grid([15, 16], [18], [22, 23], [24, 25])
+
+    def test_grid(self):
+        """Verifies only valid setpoint combinations are produced"""
+        candidates = sweep.grid([16, 19], [18], [22], [24])
+        self.assertEquals(candidates.tolist(), [[16, 18, 22, 24]])
+
+    def test_matches_heatpump(self):
+        """Verifies the vectorised actions match Heatpump.get_action"""
+        actions = sweep.actions(self.temperatures, self.setpoints, self.heater_on)
+        for column, setpoints in enumerate(self.setpoints):
+            heatpump = hp.Heatpump()
+            heatpump.setpoints = dict(zip(sweep.FIELDS, setpoints))
+            heatpump.heater = _Heater()
+            current = sweep.NONE
+            for row, temperature in enumerate(self.temperatures):
+                heatpump.heater.heater_is_on = self.heater_on[row]
+                action = heatpump.get_action(numpy.float32(temperature))
+                if action:
+                    current = _CODES[action['action']]
+                self.assertEquals(actions[row, column], current)
+
+    def test_evaluate(self):
+        """Verifies starts, runtime and time outside the comfort band"""
+        temperatures = [20, 10, 12, 20, 30, 20, 20]
+        results = sweep.evaluate(temperatures, [[16, 18, 22, 24]], interval=2,
+                                 comfort=(15, 25))
+        # heating at 10 and 12, cooling at 30, otherwise shut down
+        self.assertEquals(results['starts'][0], 2)
+        self.assertEquals(results['runtime'][0], 2 * 3)
+        self.assertEquals(results['outside'][0], 0)
+
+        results = sweep.evaluate(temperatures, [[5, 18, 22, 35]], interval=2,
+                                 comfort=(15, 25))
+        self.assertEquals(results['starts'][0], 0)
+        self.assertEquals(results['outside'][0], 2 * 3)
+
+    def test_chunks(self):
+        """Verifies chunking candidates doesn't change the results"""
+        whole = sweep.evaluate(self.temperatures, self.setpoints)
+        chunked = sweep.evaluate(self.temperatures, self.setpoints, budget=1)
+        self.assertEquals(whole.tolist(), chunked.tolist())
@@ -0,0 +1,68 @@
+"""Tests for the thing_launcher module"""
+import os
+import sys
+sys.path.append(os.path.dirname('vendored/'))
+
+# pylint: disable=wrong-import-position
+import logging
+import unittest
+
+import thing_launcher
+
+class _Controller(object): # pylint: disable=too-few-public-methods
+    """Controller which can apply any change but to pins"""
+    def __init__(self):
+        self.configs = []
+
+    def reconfigure(self, config):
+        """Records config, refusing changes to pins"""
+        if 'pins' in config:
+            return False
+        self.configs.append(config)
+        return True
+
+class ApplyConfigTest(unittest.TestCase):
+    """Tests for applying a changed config"""
+    def setUp(self):
+        self.controller = _Controller()
+        self.controllers = {'thing': self.controller}
+        self.config = {'thing': {'threshold': 40},
+                       'other': {'threshold': 40},
+                       'logging': {'test_thing_launcher': {'level': 'INFO'}}}
+
+    def _changed(self, **changes):
+        return dict(self.config, **changes)
+
+    def test_in_place(self):
+        """Verifies changes the controller can apply don't need a restart"""
+        self.assertTrue(thing_launcher.apply_config(
+            self.config, self._changed(thing={'threshold': 50}), self.controllers))
+        self.assertEquals(self.controller.configs, [{'threshold': 50}])
+
+    def test_restart(self):
+        """Verifies changes the controller can't apply need a restart"""
+        self.assertFalse(thing_launcher.apply_config(
+            self.config, self._changed(thing={'pins': 1}), self.controllers))
+
+    def test_other_thing(self):
+        """Verifies changes to things run elsewhere are ignored"""
+        self.assertTrue(thing_launcher.apply_config(
+            self.config, self._changed(other={'threshold': 50}), self.controllers))
+
+    def test_restart_on(self):
+        """Verifies keys in restart_on need a restart"""
+        self.assertFalse(thing_launcher.apply_config(
+            self.config, self._changed(things=['thing']), self.controllers, ['things']))
+
+    def test_logging_level(self):
+        """Verifies logging levels are applied in place"""
+        logging_config = {'test_thing_launcher': {'level': 'DEBUG'}}
+        self.assertTrue(thing_launcher.apply_config(
+            self.config, self._changed(logging=logging_config), self.controllers))
+        self.assertEquals(logging.getLogger('test_thing_launcher').level, logging.DEBUG)
+
+    def test_logging_handler(self):
+        """Verifies other logging changes need a restart"""
+        logging_config = {'test_thing_launcher': {'level': 'INFO', 'log_group': 'group'}}
+        self.assertFalse(thing_launcher.apply_config(
+            self.config, self._changed(logging=logging_config), self.controllers))
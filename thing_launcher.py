@@ -6,18 +6,31 @@ Launcher for various things.
 
 Symlink the thing name to thing_launcher.py and some config will happen and the
 thing will be launched.
+
+Run thing_launcher.py itself to launch every thing listed in things in one
+process, sharing one MQTT connection.
+
+How long each phase of start up took is logged by the startup logger.
+
+Changes to config.yaml are applied while running where the things allow it, and
+otherwise by restarting the launcher.
 """
+import time
+STARTED = time.time()
+
+# pylint: disable=wrong-import-position
 import importlib
 import os
 import re
+import sys
 import logging
-import yaml
-
-from botocore.exceptions import ProfileNotFound
-import boto3
-import watchtower
+import threading
 
+import config_reload
 import iot
+import startup
+
+CONFIG_PATH = 'config.yaml'
 
 def configure_logging(logging_config):
     """Configure logging"""
@@ -32,6 +45,7 @@ def configure_logging(logging_config):
         'max_batch_size': 1048576,
         'max_batch_count': 20,
     }
+    sessions = {}
 
     for module in logging_config:
         config = logging_config[module]
@@ -40,10 +54,19 @@ def configure_logging(logging_config):
         logger.setLevel(logging.__dict__[config['level']])
         logger.addHandler(stream_handler)
 
+        if 'aws_profile' not in config:
+            continue
+        # these take seconds to import on a Pi, so only load them when needed
+        from botocore.exceptions import ProfileNotFound
+        import boto3
+        import watchtower
+
         try:
-            session = boto3.session.Session(profile_name=config['aws_profile'])
+            profile = config['aws_profile']
+            if profile not in sessions:
+                sessions[profile] = boto3.session.Session(profile_name=profile)
             watchtower_config['log_group'] = config['log_group']
-            watchtower_config['boto3_session'] = session
+            watchtower_config['boto3_session'] = sessions[profile]
 
             cwlogs_handler = watchtower.CloudWatchLogHandler(**watchtower_config)
             cwlogs_handler.setFormatter(cwlogs_formatter)
@@ -54,26 +77,154 @@ def configure_logging(logging_config):
         except ProfileNotFound:
             pass
 
-if __name__ == "__main__":
-    MODULE_NAME = os.path.basename(__file__).replace('.pyc?', '')
-    MODULE = importlib.import_module(MODULE_NAME)
-
-    with open('config.yaml', 'r') as stream:
-        CONFIG = yaml.load(stream)
+def reload_logging(old_config, new_config):
+    """Applies changed logging levels, returning False if anything else changed"""
+    if set(old_config) != set(new_config):
+        return False
+    for module in new_config:
+        if config_reload.changed_keys(old_config[module], new_config[module]) - set(['level']):
+            return False
 
-    configure_logging(CONFIG['logging'])
+    for module in new_config:
+        logger = logging.getLogger(module)
+        logger.setLevel(logging.__dict__[new_config[module]['level']])
+    return True
+
+def apply_config(old_config, new_config, controllers, restart_on=()):
+    """
+    Applies what it can of a changed config in place, returning False if the
+    launcher needs restarting to apply the rest.
+
+    controllers maps thing names to their controllers; changes to other things'
+    config are ignored, as are changes to anchors such as common, which show up
+    in the things using them.  Changes to keys in restart_on always need a
+    restart.
+    """
+    for key in sorted(config_reload.changed_keys(old_config, new_config)):
+        if key == 'logging':
+            applied = reload_logging(old_config.get('logging', {}), new_config.get('logging', {}))
+        elif key in controllers:
+            reconfigure = getattr(controllers[key], 'reconfigure', None)
+            applied = reconfigure is not None and key in new_config and \
+                reconfigure(new_config[key])
+        elif key in restart_on:
+            applied = False
+        else:
+            continue
+
+        if not applied:
+            logging.getLogger(__name__).info('%s changed, restart needed', key)
+            return False
+    return True
+
+def watch_config(config, controllers, connection, restart_on=()):
+    """Applies changes to config.yaml while running, restarting if need be"""
+    current = [config]
+
+    def _on_change(new_config):
+        if apply_config(current[0], new_config, controllers, restart_on):
+            current[0] = new_config
+            return
+        for controller in controllers.values():
+            if hasattr(controller, 'stop'):
+                controller.stop()
+        connection.disconnect()
+        config_reload.restart()
+
+    watcher = config_reload.ConfigWatcher(CONFIG_PATH, _on_change,
+                                          config.get('reload_interval', 5))
+    watcher.start()
+    return watcher
+
+def connect(iot_config):
+    """Connects to AWS IoT as the thing in iot_config"""
+    credentials = iot.Credentials(root_ca_path=iot_config['root_ca_path'],
+                                  private_key_path=iot_config['private_key_path'],
+                                  certificate_path=iot_config['certificate_path'])
+
+    connection = iot.IoT(iot_config['client_id'])
+    if 'spool' in iot_config:
+        spool_config = iot_config['spool']
+        connection.start_spooling(spool_config['directory'],
+                                  spool_config.get('max_bytes', 10485760),
+                                  spool_config.get('drain_rate', 10))
+    connection.connect(iot_config['endpoint'], credentials)
+    connection.start_publisher(iot_config.get('publish_queue_size', 100))
+    connection.start_dispatcher(iot_config.get('dispatch_workers', 2),
+                                iot_config.get('dispatch_queue_size', 100))
+    if iot_config.get('shadow_coalesce_window'):
+        connection.start_coalescing(iot_config['shadow_coalesce_window'])
+    return connection
+
+def create_controller(module_name, module_config):
+    """Creates the controller for the thing module_name"""
+    with startup.phase('import'):
+        module = importlib.import_module(module_name)
+    controller_class = re.sub(r'(^|_)(.)', lambda x: x.group(2).upper(), module_name)
+    # modules may provide a create function to choose the controller from config
+    factory = module.__dict__.get('create', module.__dict__[controller_class])
+    with startup.phase('create'):
+        return factory(module_config)
+
+def launch(module_name, config):
+    """Launches the thing module_name, with its own connection"""
+    module_config = config[module_name]
+    controller = create_controller(module_name, module_config)
+    with startup.phase('connect'):
+        controller.iot = connect(module_config['aws_iot'])
+    watch_config(config, {module_name: controller}, controller.iot)
+    startup.report_when_started([controller])
+    controller.start()
+
+def launch_all(module_names, config):
+    """
+    Launches several things in one process.
+
+    The things share the first thing's MQTT connection, publish queue and spool,
+    each publishing to its own shadow, so the first thing's certificate must be
+    allowed to use the others' topics.  Each controller runs in its own thread;
+    if one stops the process exits so the service manager restarts them all.
+    """
+    with startup.phase('connect'):
+        connection = connect(config[module_names[0]]['aws_iot'])
+
+    threads = []
+    controllers = {}
+    for module_name in module_names:
+        module_config = config[module_name]
+        controller = create_controller(module_name, module_config)
+        controllers[module_name] = controller
+        client_id = module_config['aws_iot']['client_id']
+        if client_id == connection.client_id:
+            controller.iot = connection
+        else:
+            controller.iot = connection.thing(client_id)
+
+        thread = threading.Thread(target=controller.start, name=module_name)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    watch_config(config, controllers, connection, restart_on=['things'])
+    startup.report_when_started(controllers.values())
+    while all(thread.is_alive() for thread in threads):
+        time.sleep(1)
+
+    stopped = [thread.name for thread in threads if not thread.is_alive()]
+    logging.getLogger(__name__).error('%s stopped, exiting', ', '.join(stopped))
+    sys.exit(1)
 
-    MODULE_CONFIG = CONFIG[MODULE_NAME]
-    IOT_CONFIG = MODULE_CONFIG['aws_iot']
+if __name__ == "__main__":
+    MODULE_NAME = os.path.splitext(os.path.basename(__file__))[0]
+    startup.record('import', time.time() - STARTED)
 
-    CREDENTIALS = iot.Credentials(root_ca_path=IOT_CONFIG['root_ca_path'],
-                                  private_key_path=IOT_CONFIG['private_key_path'],
-                                  certificate_path=IOT_CONFIG['certificate_path'])
+    with startup.phase('config'):
+        CONFIG = config_reload.load(CONFIG_PATH)
 
-    IOT = iot.IoT(IOT_CONFIG['client_id'])
-    IOT.connect(IOT_CONFIG['endpoint'], CREDENTIALS)
+        configure_logging(CONFIG['logging'])
 
-    CONTROLLER_CLASS = re.sub(r'(^|_)(.)', lambda x: x.group(2).upper(), MODULE_NAME)
-    CONTROLLER = MODULE.__dict__[CONTROLLER_CLASS](MODULE_CONFIG)
-    CONTROLLER.iot = IOT
-    CONTROLLER.start()
+    if MODULE_NAME == 'thing_launcher':
+        # run directly, the launcher starts every thing listed in things
+        launch_all(CONFIG['things'], CONFIG)
+    else:
+        launch(MODULE_NAME, CONFIG)